@@ -18,14 +18,22 @@
 # pylint: disable=fixme,invalid-name
 
 import logging
+import multiprocessing
+import os
+import queue
+import shutil
 import sys
-from typing import List
+import tempfile
+from typing import List, Tuple
 
 import definitions
 import dfvfs.lib.definitions as dfvfs_defs
 import forensicstore
+from dfvfs.resolver import context as dfvfs_context
+from dfvfs.resolver import resolver
 from artifact_resolver import ArtifactResolver
 from definitions import PartitionInfo
+from file_index import FileIndex
 from os_unknown import UnknownOS
 from os_windows import WindowsSystem
 from pyartifacts import Registry
@@ -34,6 +42,52 @@ import dfvfs_helper
 
 LOGGER = logging.getLogger(__name__)
 
+# Buffer size for copying the files of a worker store into the output store
+COPY_BUFFER_SIZE = 16 * 1024 * 1024
+
+# registry and encryption handler of the worker processes, filled in by the
+# parent before the pool forks so they are inherited instead of pickled
+_WORKER_STATE = {}
+
+
+def _extract_partition(source_path: str, zip_mode: bool, index: int, name: str, artifact_names: List[str],
+                       store_dir: str) -> str:
+    """
+    Extract artifacts from a single partition in a worker process. The
+    worker opens the source with a fresh dfVFS resolver context, objects
+    opened by the parent are not shared, and writes into its own store,
+    which is returned to be merged by the parent.
+    """
+    resolver.Resolver._resolver_context = dfvfs_context.Context()  # pylint: disable=protected-access
+    helper = dfvfs_helper.DFVFSHelper(source_path, _WORKER_STATE['encryption_handler'])
+    store_path = os.path.join(store_dir, name + ".forensicstore")
+    store = forensicstore.new(store_path)
+    try:
+        partinfo = PartitionInfo(helper=helper, path_spec=ArtifactExtractor.partition_specs(helper, zip_mode)[index],
+                                 name=name)
+        ArtifactExtractor.process_partition(partinfo, _WORKER_STATE['artifact_registry'], artifact_names, store,
+                                            _WORKER_STATE['file_index'], _WORKER_STATE['file_index_dir'])
+    finally:
+        store.close()
+        helper.clean_up()
+    return store_path
+
+
+def merge_store(store: forensicstore.ForensicStore, url: str):
+    """ Import the elements of another store, its files are copied in chunks instead of being read into memory """
+    other = forensicstore.open(url)
+    try:
+        for element in other.all():
+            for field in list(element):
+                if field.endswith("_path"):
+                    with other.load_file(element[field]) as src, \
+                            store.store_file(element[field]) as (file_path, dest):
+                        shutil.copyfileobj(src, dest, COPY_BUFFER_SIZE)
+                    element[field] = file_path
+            store.insert(element)
+    finally:
+        other.close()
+
 
 class ArtifactExtractor(object):
     """
@@ -44,8 +98,12 @@ class ArtifactExtractor(object):
 
     def __init__(self, source_paths: List[str], output_store: forensicstore.ForensicStore, 
                  artifact_registry: Registry, encryption_handler: dfvfs_helper.EncryptionHandler,
-                 zip_mode: bool = False):
+                 zip_mode: bool = False, workers: int = 1, file_index: bool = False, file_index_dir: str = None):
         self.dfvfs_list = []
+        self.source_paths = source_paths
+        self.workers = workers
+        self.file_index = file_index
+        self.file_index_dir = file_index_dir
         self.artifact_registry = artifact_registry
         self.tmp_dir = None
         self.zip_mode = zip_mode
@@ -72,50 +130,117 @@ class ArtifactExtractor(object):
             self.tmp_dir.cleanup()
             self.tmp_dir = None
 
+    @staticmethod
+    def partition_specs(helper: dfvfs_helper.DFVFSHelper, zip_mode: bool) -> List:
+        """ Return the path specs of the partitions to process in a dfVFS source """
+        if zip_mode:
+            # zip extract have exactly one partition per dfvfs instance (zip file)
+            return helper.partitions()[:1]
+        # forensic images can have more than one partition, but we always only process one image at a time
+        return [partition for partition in helper.partitions()
+                if not dfvfs_helper.is_on_filesystem(partition, dfvfs_defs.TYPE_INDICATOR_VSHADOW)]
+
+    def _partitions(self) -> List[Tuple[PartitionInfo, str, int]]:
+        """ Return every partition to process with its source path and index within that source """
+        if self.zip_mode:
+            return [(PartitionInfo(helper=d, path_spec=self.partition_specs(d, True)[0], name=chr(ord('c') + i)),
+                     self.source_paths[i], 0)
+                    for i, d in enumerate(self.dfvfs_list)]
+        return [(PartitionInfo(helper=self.dfvfs_list[0], path_spec=partition, name=chr(ord('c') + i)),
+                 self.source_paths[0], i)
+                for i, partition in enumerate(self.partition_specs(self.dfvfs_list[0], False))]
+
     def extract_artifact(self, artifact_name):  # pylint: disable=invalid-name
         """
         Extract a particular artifact from all possible locations within this dfvfs-image
         """
-        real_partitions: List[PartitionInfo] = []
+        self.extract_artifacts([artifact_name])
 
-        if self.zip_mode:
-            # zip extract have exactly one partition per dfvfs instance (zip file)
-            real_partitions = [PartitionInfo(helper=d, path_spec=d.partitions()[0], name=chr(ord('c') + i))
-                               for i, d in enumerate(self.dfvfs_list)]
-        else:
-            # forensic images can have more than one partition, but we always only process one image at a time
-            real_partitions = [PartitionInfo(helper=self.dfvfs_list[0], path_spec=partition, name=chr(ord('c') + i))
-                               for i, partition in enumerate(self.dfvfs_list[0].partitions())
-                               if not dfvfs_helper.is_on_filesystem(partition, dfvfs_defs.TYPE_INDICATOR_VSHADOW)]
+    def extract_artifacts(self, artifact_names: List[str]):
+        """
+        Extract several artifacts from all possible locations within this dfvfs-image. Every partition
+        is only set up once for all of them.
+        """
+        real_partitions = self._partitions()
         LOGGER.info("Found %d partitions", len(real_partitions))
-        for partinfo in real_partitions:
-            current_os = self._guess_os(partinfo.helper, partinfo.path_spec)
-            try:
-                if current_os == definitions.OPERATING_SYSTEM_WINDOWS:
-                    system = WindowsSystem(partinfo.helper, partinfo.path_spec)
-
-                elif current_os == definitions.OPERATING_SYSTEM_UNKNOWN:
-                    system = UnknownOS()
-                    LOGGER.warning("Operating system not detected on partition %s. Only basic extraction possible.",
-                                   dfvfs_helper.reconstruct_full_path(partinfo.path_spec))
-                else:
-                    LOGGER.warning("Operating system %s is not yet supported on %s. Using basic extraction.",
-                                   dfvfs_helper.reconstruct_full_path(partinfo.path_spec), current_os)
-                    system = UnknownOS()
-
-                LOGGER.info("=== Starting processing of partition")
-                resolver = ArtifactResolver(partinfo, self.artifact_registry, system)
-                resolver.process_artifact(artifact_name, self.store)
-
-                if current_os == definitions.OPERATING_SYSTEM_WINDOWS:
-                    system._reg_reader._cleanup_open_files("")  # TODO
-
-            except RuntimeError as err:
-                LOGGER.exception("Encountered exception during processing of %s: %s",
-                                 dfvfs_helper.reconstruct_full_path(partinfo.path_spec), err)
-                if 'pytest' in sys.modules:
-                    raise  # we want to see what exactly is failing when tests are running
 
+        if self.workers > 1 and len(real_partitions) > 1:
+            self._extract_parallel(real_partitions, artifact_names)
+            return
+
+        for partinfo, _, _ in real_partitions:
+            self.process_partition(partinfo, self.artifact_registry, artifact_names, self.store,
+                                   self.file_index, self.file_index_dir)
+
+    def _extract_parallel(self, real_partitions, artifact_names):
+        """
+        Extract artifacts with one worker process per partition. Every
+        worker writes into a temporary store that is merged into the output
+        store as soon as the worker is done.
+        """
+        store_dir = tempfile.mkdtemp()
+        _WORKER_STATE.update(artifact_registry=self.artifact_registry, encryption_handler=self.encryption_handler,
+                             file_index=self.file_index, file_index_dir=self.file_index_dir)
+        # results are handed over in the order the workers finish
+        finished = queue.Queue()
+        try:
+            with multiprocessing.get_context("fork").Pool(min(self.workers, len(real_partitions))) as pool:
+                for partinfo, source_path, index in real_partitions:
+                    pool.apply_async(_extract_partition,
+                                     (source_path, self.zip_mode, index, partinfo.name, artifact_names, store_dir),
+                                     callback=lambda store_path, partinfo=partinfo: finished.put(
+                                         (partinfo, store_path, None)),
+                                     error_callback=lambda err, partinfo=partinfo: finished.put(
+                                         (partinfo, None, err)))
+                for _ in real_partitions:
+                    partinfo, store_path, err = finished.get()
+                    if err is not None:
+                        LOGGER.error("Encountered exception during processing of %s: %s",
+                                     dfvfs_helper.reconstruct_full_path(partinfo.path_spec), err, exc_info=err)
+                        if 'pytest' in sys.modules:
+                            raise err
+                        continue
+                    merge_store(self.store, store_path)
+        finally:
+            _WORKER_STATE.clear()
+            shutil.rmtree(store_dir, ignore_errors=True)
+
+    @classmethod
+    def process_partition(cls, partinfo: PartitionInfo, artifact_registry: Registry, artifact_names: List[str],
+                          store: forensicstore.ForensicStore, file_index: bool = False, file_index_dir: str = None):
+        """
+        Detect the operating system of a partition and extract artifacts from it. The operating system,
+        its registry and the variables the artifacts need are only set up once per partition.
+        With file_index, file globs of NTFS partitions are answered from an index of the MFT, which
+        is persisted to and loaded from file_index_dir if that is given.
+        """
+        current_os = cls._guess_os(partinfo.helper, partinfo.path_spec)
+        try:
+            if current_os == definitions.OPERATING_SYSTEM_WINDOWS:
+                system = WindowsSystem(partinfo.helper, partinfo.path_spec)
+
+            elif current_os == definitions.OPERATING_SYSTEM_UNKNOWN:
+                system = UnknownOS()
+                LOGGER.warning("Operating system not detected on partition %s. Only basic extraction possible.",
+                               dfvfs_helper.reconstruct_full_path(partinfo.path_spec))
+            else:
+                LOGGER.warning("Operating system %s is not yet supported on %s. Using basic extraction.",
+                               dfvfs_helper.reconstruct_full_path(partinfo.path_spec), current_os)
+                system = UnknownOS()
+
+            LOGGER.info("=== Starting processing of partition")
+            index = FileIndex.for_partition(partinfo, file_index_dir) if file_index else None
+            resolver = ArtifactResolver(partinfo, artifact_registry, system, file_index=index)
+            resolver.process_artifacts(artifact_names, store)
+
+            if current_os == definitions.OPERATING_SYSTEM_WINDOWS:
+                system._reg_reader._cleanup_open_files("")  # TODO
+
+        except RuntimeError as err:
+            LOGGER.exception("Encountered exception during processing of %s: %s",
+                             dfvfs_helper.reconstruct_full_path(partinfo.path_spec), err)
+            if 'pytest' in sys.modules:
+                raise  # we want to see what exactly is failing when tests are running
 
     @staticmethod
     def _guess_os(dfvfs, partition):
@@ -20,11 +20,13 @@ import logging
 import re
 import sqlite3
 from datetime import datetime
-from typing import List, Tuple, Optional, Iterable, Dict
+from typing import List, Tuple, Optional, Iterable, Dict, Set
 
 import dfvfs.lib.definitions as dfvfs_defs
 import dfvfs_helper
 from definitions import PartitionInfo
+from file_index import FileIndex
+from glob_planner import GlobPlanner
 from dfvfs.path.path_spec import PathSpec
 from dfwinreg.interface import WinRegistryKey
 from forensicstore import ForensicStore
@@ -67,13 +69,16 @@ class ArtifactResolver:
     This class converts artifacts to actual bits of information
     """
 
-    def __init__(self, partinfo: PartitionInfo, artifacts_registry: Registry, system: OperatingSystemBase = None):
+    def __init__(self, partinfo: PartitionInfo, artifacts_registry: Registry, system: OperatingSystemBase = None,
+                 file_index: FileIndex = None):
         """
         Initializes the class and loads artifacts
         :param partinfo: The partition to analyze
         :param artifacts_registry: Database of forensic artifacts definitions
         :param system: optional reference to a OperatingSystem-instance for
                        further variable resolving
+        :param file_index: optional index of all paths of the partition, file globs are
+                           answered from it without a depth limit for superglobs
         """
         # pylint: disable=invalid-name,too-many-instance-attributes,too-many-arguments
         self.dfvfs = partinfo.helper
@@ -96,6 +101,12 @@ class ArtifactResolver:
         self.knowledge_base = KnowledgeBase(self.artifacts)
         # hard code values that cannot be resolved with their provides-definition for implementation reasons
         self.knowledge_cache: Dict[str, Iterable[str]] = {'environ_systemdrive': '/'}
+        # artifacts are resolved once per partition, also when they are part of several groups
+        self.resolved_cache: Dict[str, Optional[ResolvedArtifact]] = {}
+        # while set, file globs are collected here and matched together by resolve_pending_globs
+        self.glob_planner: Optional[GlobPlanner] = None
+        self.file_index = file_index
+        self.pending_globs: List[Tuple[List[PathSpec], List[str]]] = []
 
     def _resolve_artifact(self, artifact: ArtifactDefinition) -> ResolvedArtifact:
         # pylint: disable=too-many-locals,too-many-branches,too-many-nested-blocks
@@ -124,16 +135,16 @@ class ArtifactResolver:
 
             # FILE: Single file(s): Might be wildcarded
             if source.type == artifact_defs.SOURCE_TYPE_FILE:
-                files.extend(self.glob_file_paths(self._expand_paths(source.paths, source.separator)))
+                self._glob_into(files, self._expand_paths(source.paths, source.separator), artifact)
 
             # DIRECTORY: An (absolute) directory (might be wildcarded)
             # Used to obtain a directory listing
             elif source.type == artifact_defs.SOURCE_TYPE_DIRECTORY:
-                dirs.extend(self.glob_file_paths(self._expand_paths(source.paths, source.separator)))
+                self._glob_into(dirs, self._expand_paths(source.paths, source.separator), artifact)
 
             # A path specification
             elif source.type == artifact_defs.SOURCE_TYPE_PATH:
-                paths.extend(self.glob_file_paths(self._expand_paths(source.paths, source.separator)))
+                self._glob_into(paths, self._expand_paths(source.paths, source.separator), artifact)
 
             # REGISTRY_KEY: Whole key with all values (may be wildcarded)
             elif source.type == artifact_defs.SOURCE_TYPE_REGISTRY_KEY:
@@ -168,6 +179,32 @@ class ArtifactResolver:
 
         return ResolvedArtifact(artifact, files, dirs, paths, registry_keys, registry_vals, sub_artifacts)
 
+    def _glob_into(self, results: List[PathSpec], paths: List[str], artifact: ArtifactDefinition):
+        """
+        Glob paths into a result list of a ResolvedArtifact. While a glob planner is active, the globs
+        are only recorded and the list is filled by resolve_pending_globs. Variables are always resolved
+        right away, their values are needed before the walk.
+        """
+        if self.glob_planner is None or self.file_index or artifact.name == TEMPORARY_RESOLVE:
+            results.extend(self.glob_file_paths(paths))
+            return
+        paths_to_find = self.resolve_superglobs(paths)
+        if paths_to_find:
+            self.glob_planner.add(paths_to_find)
+            self.pending_globs.append((results, paths_to_find))
+
+    def resolve_pending_globs(self):
+        """ Match all recorded globs with a single walk over the partition and fill in the results """
+        planner, self.glob_planner = self.glob_planner, None
+        pending, self.pending_globs = self.pending_globs, []
+        if not planner or not pending:
+            return
+
+        matches = planner.match(self.dfvfs, self.partition)
+        for results, paths_to_find in pending:
+            for path in paths_to_find:
+                results.extend(matches.get(path, []))
+
     def _resolve_source(self, source: ArtifactSource) -> Iterable[str]:
         """ This is used as the callback function for KnowledgeBase to do variable resolving"""
         LOGGER.debug('Resolving source: %s:%s', source.type, source.__dict__)
@@ -306,6 +343,12 @@ class ArtifactResolver:
         :param artifact_name: [str]: Name of the artifact
         :return: ResolvedArtifact instance or None if the artifact was not found or is not supported
         """
+        if artifact_name not in self.resolved_cache:
+            self.resolved_cache[artifact_name] = self._get_resolved_artifact(artifact_name)
+        return self.resolved_cache[artifact_name]
+
+    def _get_resolved_artifact(self, artifact_name: str) -> Optional[ResolvedArtifact]:
+        """ Uncached part of get_resolved_artifact """
         artifact = self.artifacts.get(artifact_name, None)
         if not artifact:
             LOGGER.warning("Unknown or non-applicable artifact: %s", artifact_name)
@@ -332,9 +375,10 @@ class ArtifactResolver:
             except RuntimeError as err:
                 LOGGER.info("Caught error while trying to load artifact [%s]: %s", artifact, err)
 
-    def extract(self, artifact: ResolvedArtifact, store: ForensicStore) -> bool:
+    def extract(self, artifact: ResolvedArtifact, store: ForensicStore, extracted_names: Set[str] = None) -> bool:
         """
         Extract an artifact to an export directory by creating a new ForensicStore there
+        :param extracted_names: optional set of artifact names that were already extracted and are skipped
         :return: True on success, false if nothing was extracted, raises RuntimeError otherwise
         """
 
@@ -342,6 +386,11 @@ class ArtifactResolver:
             return False
 
         artifact_name = artifact.artifact.name
+        if extracted_names is not None:
+            if artifact_name in extracted_names:
+                LOGGER.debug("Already extracted %s", artifact_name)
+                return False
+            extracted_names.add(artifact_name)
 
         if artifact.empty():
             LOGGER.debug("Nothing to extract found for %s", artifact_name)
@@ -353,7 +402,7 @@ class ArtifactResolver:
         # handle sub-artifacts for ARTIFACT_GROUP and extract them to our output folder
         for sub in artifact.sub_artifacts:
             LOGGER.debug("Attemping extract of sub-artifact %s", sub.artifact.name)
-            extracted |= self.extract(sub, store)
+            extracted |= self.extract(sub, store, extracted_names)
 
         if extracted:
             LOGGER.info("Extracted %s", artifact_name)
@@ -516,6 +565,9 @@ class ArtifactResolver:
         :param paths: [List[str]]: List of file paths with globbing characters (*, **)
         :return: List[PathSpec] of results from globbing on this system's partition
         """
+        if self.file_index:
+            return self.file_index.glob(paths)
+
         result = []
         paths_to_find = self.resolve_superglobs(paths)
 
@@ -640,3 +692,32 @@ class ArtifactResolver:
             return False
 
         return self.extract(artifact, store)
+
+    def process_artifacts(self, artifact_names: Iterable[str], store: ForensicStore) -> bool:
+        """
+        Start the extraction process of several artifacts. All of them are
+        resolved first with the shared variable cache and their file globs are
+        matched in a single walk, then they are extracted. Artifacts contained
+        in more than one of them are only extracted once.
+        :param artifact_names: Names of the artifacts
+        :param store: ForensicStorage output
+        :return: True if anything was extracted, False otherwise
+        """
+        resolved = []
+        self.glob_planner = GlobPlanner()
+        try:
+            for artifact_name in artifact_names:
+                LOGGER.debug("Attempting extract of %s", artifact_name)
+                artifact = self.get_resolved_artifact(artifact_name)
+                if artifact:
+                    resolved.append(artifact)
+            self.resolve_pending_globs()
+        finally:
+            self.glob_planner = None
+            self.pending_globs = []
+
+        extracted = False
+        extracted_names: Set[str] = set()
+        for artifact in resolved:
+            extracted |= self.extract(artifact, store, extracted_names)
+        return extracted
@@ -16,11 +16,12 @@
 # Author(s): Demian Kellermann
 """ Package to ease use of dfvfs """
 
-from .dfvfs_helper import DFVFSHelper, EncryptionHandler
+from .dfvfs_helper import DFVFSHelper, EncryptionHandler, DirectoryEntry, glob_segment_regex, is_glob_segment
 from .dfvfs_utils import reconstruct_full_path, is_on_filesystem, get_file_handle, get_relative_path, \
     pathspec_to_fileentry, export_file
 from .encryption_handlers import ConsoleEncryptionHandler, read_key_list
 
-__all__ = ['DFVFSHelper', 'EncryptionHandler', 'reconstruct_full_path', 'is_on_filesystem', 'get_file_handle',
-           'get_relative_path', 'pathspec_to_fileentry', 'export_file',
+__all__ = ['DFVFSHelper', 'EncryptionHandler', 'DirectoryEntry', 'glob_segment_regex', 'is_glob_segment',
+           'reconstruct_full_path', 'is_on_filesystem', 'get_file_handle', 'get_relative_path',
+           'pathspec_to_fileentry', 'export_file',
            'ConsoleEncryptionHandler', 'read_key_list']
@@ -22,6 +22,8 @@ import re
 import locale
 import logging
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
 
 from dfvfs.lib import definitions
 from dfvfs.lib import glob2regex
@@ -34,6 +36,23 @@ from .dfvfs_utils import get_file_handle
 
 LOGGER = logging.getLogger(__name__)
 
+# Number of directory listings a helper keeps
+DIRECTORY_CACHE_SIZE = 4096
+
+# An entry of a cached directory listing
+DirectoryEntry = namedtuple('DirectoryEntry', ['name', 'path_spec', 'is_directory'])
+
+
+@lru_cache(maxsize=1024)
+def is_glob_segment(segment):
+    """ check if a path segment contains wildcards or character classes """
+    return '*' in segment or '?' in segment or '[' in segment
+
+
+def glob_segment_regex(segment):
+    """ Compile a glob for a single path segment, case insensitive """
+    return re.compile(glob2regex.Glob2Regex(segment), re.IGNORECASE)
+
 
 class EncryptionHandler(object, metaclass=ABCMeta):  # pylint: disable=too-few-public-methods
     """ this class defines the interface for handling password prompts """
@@ -364,11 +383,16 @@ class DFVFSHelperMediator(volume_scanner.VolumeScannerMediator):
 class DFVFSHelper(volume_scanner.VolumeScanner):
     """ A helper object for a particular image file or folder """
 
-    def __init__(self, evidence, encryption_handler, vss='all', partitions='all'):
+    def __init__(self, evidence, encryption_handler, vss='all', partitions='all',
+                 directory_cache_size=DIRECTORY_CACHE_SIZE):
         mediator = DFVFSHelperMediator(encryption=encryption_handler,
                                        vss=vss, partitions=partitions)
         super(DFVFSHelper, self).__init__(mediator=mediator)
 
+        # LRU of (partition, case folded path) -> directory listing
+        self._directory_cache = OrderedDict()
+        self._directory_cache_size = directory_cache_size
+
         self.evidence = evidence
         if not os.path.exists(self.evidence):
             raise RuntimeError("Source does not exist: %s" % self.evidence)
@@ -432,6 +456,72 @@ class DFVFSHelper(volume_scanner.VolumeScanner):
         """
         return self.base_path_specs
 
+    def list_directory(self, path, partition=None):
+        """
+        List a directory through the directory cache. Names are compared case insensitively,
+        so the listing of a path covers every directory whose path only differs in case.
+        :param path: '/' separated path from the partition root
+        :param partition: optional: partition of the path (from partitions() ), defaults to the first
+        :return: Dict of case folded name -> List[DirectoryEntry], or None if the path is not a directory
+        """
+        if not partition:
+            partition = self.base_path_specs[0]
+        segments = [segment.casefold() for segment in path.split('/') if segment]
+        key = (partition.comparable, '/'.join(segments))
+        if key in self._directory_cache:
+            self._directory_cache.move_to_end(key)
+            return self._directory_cache[key]
+
+        path_specs = [partition]
+        if segments:
+            parent = self.list_directory('/'.join(segments[:-1]), partition)
+            path_specs = [entry.path_spec for entry in (parent or {}).get(segments[-1], []) if entry.is_directory]
+
+        listing = None
+        for path_spec in path_specs:
+            try:
+                file_entry = resolver.Resolver.OpenFileEntry(path_spec)
+                if file_entry is None:
+                    continue
+                entries = [DirectoryEntry(sub_file_entry.name, sub_file_entry.path_spec, sub_file_entry.IsDirectory())
+                           for sub_file_entry in file_entry.sub_file_entries if sub_file_entry.name]
+            except dfvfs_errors.Error as error:
+                LOGGER.warning("Unable to list %s: %s", path, error)
+                continue
+            if listing is None:
+                listing = {}
+            for entry in entries:
+                listing.setdefault(entry.name.casefold(), []).append(entry)
+
+        self._directory_cache[key] = listing
+        if len(self._directory_cache) > self._directory_cache_size:
+            self._directory_cache.popitem(last=False)
+        return listing
+
+    def _glob_cached(self, location, partition):
+        """
+        Case insensitive glob of a location through the directory cache
+        :return: list of PathSpec results
+        """
+        matches = [('', None)]
+        for segment in [segment for segment in location.split('/') if segment]:
+            regex = glob_segment_regex(segment) if is_glob_segment(segment) else None
+            next_matches = []
+            # directories whose paths only differ in case share one listing
+            for path in dict.fromkeys(path.casefold() for path, _ in matches):
+                listing = self.list_directory(path, partition)
+                if not listing:
+                    continue
+                if regex:
+                    next_matches.extend((path + '/' + entry.name, entry)
+                                        for entries in listing.values() for entry in entries
+                                        if regex.fullmatch(entry.name))
+                else:
+                    next_matches.extend((path + '/' + entry.name, entry)
+                                        for entry in listing.get(segment.casefold(), []))
+            matches = next_matches
+        return [entry.path_spec for _, entry in matches if entry]
+
     def all(self, partitions=None):
         """
         Recursively walk over every entry in the source
@@ -477,6 +567,7 @@ class DFVFSHelper(volume_scanner.VolumeScanner):
     def find_paths(self, locations, case_sensitive=False, regex=False, partitions=None):
         """
         Fast search for paths inside the volume. Must match path depth exactly!
+        Case insensitive globs are served from the directory cache.
         :param locations: list of search strings
         :param case_sensitive: bool
         :param regex: bool if search strings contain regex
@@ -490,6 +581,16 @@ class DFVFSHelper(volume_scanner.VolumeScanner):
             LOGGER.debug("dfvfs.find_paths called with empty search specs")
             return
 
+        if not regex and not case_sensitive:
+            for base_path_spec in partitions:
+                found = set()
+                for search in locations:
+                    for path_spec in self._glob_cached(search, base_path_spec):
+                        if path_spec.comparable not in found:
+                            found.add(path_spec.comparable)
+                            yield path_spec
+            return
+
         specs = []
         for search in locations:
             if regex:
@@ -546,11 +647,16 @@ class DFVFSHelper(volume_scanner.VolumeScanner):
 
         # we do not need the path calculation in self.all() here
         # might save some time, but this duplicates some code..
+        # the walk bypasses the directory cache, it would evict the listings of the globs
         if not partitions:
             partitions = self.base_path_specs
         stack = []
         for base_path_spec in partitions:
-            file_entry = resolver.Resolver.OpenFileEntry(base_path_spec)
+            try:
+                file_entry = resolver.Resolver.OpenFileEntry(base_path_spec)
+            except dfvfs_errors.Error as err:
+                LOGGER.warning("Unable to open partition %s: %s", base_path_spec.comparable, err)
+                continue
             if file_entry is None:
                 logging.warning('Unable to open base path specification:\n{0:s}'
                                 .format(base_path_spec.comparable))
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# Copyright (c) 2020 Siemens AG
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Index of every path of an NTFS partition, built by reading the MFT once.
+Globs, including unbounded superglobs (**), are answered by scanning the
+sorted index instead of walking the file system.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import dfvfs.lib.definitions as dfvfs_defs
+import pyfsntfs
+from definitions import PartitionInfo
+from dfvfs.lib import errors as dfvfs_errors
+from dfvfs.path import factory as path_spec_factory
+from dfvfs.path.path_spec import PathSpec
+from dfvfs.resolver import resolver
+
+LOGGER = logging.getLogger(__name__)
+
+# MFT entry of the root directory
+NTFS_ROOT_ENTRY = 5
+# Attribute type of $FILE_NAME and its namespace for short (8.3) names
+NTFS_FILE_NAME_ATTRIBUTE = 0x30
+NTFS_DOS_NAMESPACE = 2
+# The lower 48 bits of a file reference are the MFT entry
+NTFS_ENTRY_MASK = 0xffffffffffff
+
+INDEX_EXTENSION = '.fileindex'
+
+SCHEMA = [
+    "DROP TABLE IF EXISTS file_index_info",
+    "DROP TABLE IF EXISTS file_index",
+    "CREATE TABLE file_index_info (partition TEXT NOT NULL, volume TEXT NOT NULL)",
+    "CREATE TABLE file_index ("
+    "folded TEXT NOT NULL, path TEXT NOT NULL, entry INTEGER NOT NULL, is_directory INTEGER NOT NULL, "
+    "PRIMARY KEY (folded, entry)) WITHOUT ROWID",
+]
+
+# superglobs, wildcards and character classes like dfVFS glob2regex: a ']' right after
+# '[' or '[!' is part of the class and an unclosed '[' is a literal
+GLOB_TOKENS = re.compile(r'\*\*\d*|\*|\?|\[(?=(!?\]?))\1[^\]/]*\]')
+
+
+def glob_to_regex(pattern: str) -> str:
+    """
+    Convert a case folded glob to a regex over full paths. A superglob (**) matches
+    any number of path segments, a superglob with a depth (**3) at most that many.
+    """
+    regex = []
+    position = 0
+    for match in GLOB_TOKENS.finditer(pattern):
+        regex.append(re.escape(pattern[position:match.start()]))
+        position = match.end()
+        token = match.group()
+        if token == '**':
+            regex.append('.*')
+        elif token.startswith('**'):
+            regex.append('[^/]*(?:/[^/]*){0,%d}' % (int(token[2:]) - 1))
+        elif token == '*':
+            regex.append('[^/]*')
+        elif token == '?':
+            regex.append('[^/]')
+        else:
+            negate = token.startswith('[!')
+            group = token[2 if negate else 1:-1].replace('\\', '\\\\').replace('[', '\\[').replace(']', '\\]')
+            if group.startswith('^'):
+                group = '\\' + group
+            regex.append('[^/' + group + ']' if negate else '[' + group + ']')
+    regex.append(re.escape(pattern[position:]))
+    return ''.join(regex)
+
+
+def literal_prefix(segments: List[str]) -> List[str]:
+    """ leading path segments without wildcards """
+    prefix = []
+    for segment in segments:
+        if '*' in segment or '?' in segment or '[' in segment:
+            break
+        prefix.append(segment)
+    return prefix
+
+
+@contextmanager
+def open_volume(partition: PathSpec):
+    """ Open the NTFS volume of a partition with pyfsntfs """
+    file_object = resolver.Resolver.OpenFileObject(partition.parent)
+    volume = pyfsntfs.volume()
+    try:
+        volume.open_file_object(file_object)
+        try:
+            yield volume
+        finally:
+            volume.close()
+    finally:
+        file_object.close()
+
+
+def volume_identity(partition: PathSpec) -> str:
+    """ Identify the NTFS volume of a partition by its serial number and the size of its MFT """
+    with open_volume(partition) as volume:
+        return '%016x:%d' % (volume.serial_number, volume.number_of_file_entries)
+
+
+def read_mft(partition: PathSpec) -> Iterable[Tuple[str, int, bool]]:
+    """
+    Read the MFT of an NTFS partition sequentially
+    :return: path, MFT entry and directory flag of every allocated entry (hard links yield several paths)
+    """
+    with open_volume(partition) as volume:
+        # MFT entry -> list of (parent entry, name) and the directory flag
+        names: Dict[int, List[Tuple[int, str]]] = {}
+        directories = set()
+        for entry in range(volume.number_of_file_entries):
+            try:
+                file_entry = volume.get_file_entry(entry)
+                if not file_entry.is_allocated():
+                    continue
+                for attribute_index in range(file_entry.number_of_attributes):
+                    attribute = file_entry.get_attribute(attribute_index)
+                    if attribute.attribute_type != NTFS_FILE_NAME_ATTRIBUTE:
+                        continue
+                    if attribute.name_space == NTFS_DOS_NAMESPACE or not attribute.name:
+                        continue
+                    parent = attribute.parent_file_reference & NTFS_ENTRY_MASK
+                    if (parent, attribute.name) not in names.setdefault(entry, []):
+                        names[entry].append((parent, attribute.name))
+                if file_entry.has_directory_entries_index():
+                    directories.add(entry)
+            except IOError as err:
+                LOGGER.debug("Skipping MFT entry %d: %s", entry, err)
+
+    # directory paths, resolved from the root down and memoized
+    directory_paths = {NTFS_ROOT_ENTRY: ''}
+
+    def directory_path(entry: int) -> Optional[str]:
+        chain = []
+        while entry not in directory_paths:
+            if entry not in directories or entry not in names or entry in chain:
+                directory_paths[entry] = None  # orphaned, or a loop in a damaged MFT
+                break
+            chain.append(entry)
+            entry = names[entry][0][0]
+        for child in reversed(chain):
+            parent_path = directory_paths[names[child][0][0]]
+            directory_paths[child] = None if parent_path is None else parent_path + '/' + names[child][0][1]
+        return directory_paths[chain[0] if chain else entry]
+
+    for entry, entry_names in names.items():
+        if entry == NTFS_ROOT_ENTRY:
+            continue
+        for parent, name in entry_names:
+            parent_path = directory_path(parent)
+            if parent_path is not None:
+                yield parent_path + '/' + name, entry, entry in directories
+
+
+class FileIndex(object):
+    """
+    Sorted index of the case folded paths of a partition. The index lists
+    are kept parallel: folded path, path, MFT entry and directory flag.
+    The volume identity tells persisted indexes of different volumes apart.
+    """
+
+    def __init__(self, partition: PathSpec, rows: Iterable[Tuple[str, int, bool]], volume: str = ''):
+        self.partition = partition
+        self.volume = volume
+        rows = sorted(((path.casefold(), path, entry, is_directory) for path, entry, is_directory in rows))
+        self.folded = [row[0] for row in rows]
+        self.paths = [row[1] for row in rows]
+        self.entries = [row[2] for row in rows]
+        self.is_directory = [row[3] for row in rows]
+
+    def __len__(self):
+        return len(self.paths)
+
+    @staticmethod
+    def supports(partition: PathSpec) -> bool:
+        """ check if a partition holds an NTFS volume whose MFT can be read """
+        if partition.type_indicator not in (dfvfs_defs.TYPE_INDICATOR_TSK, dfvfs_defs.TYPE_INDICATOR_NTFS):
+            return False
+        if not partition.parent:
+            return False
+        try:
+            file_object = resolver.Resolver.OpenFileObject(partition.parent)
+        except dfvfs_errors.Error:
+            return False
+        try:
+            return pyfsntfs.check_volume_signature_file_object(file_object)
+        finally:
+            file_object.close()
+
+    @classmethod
+    def build(cls, partition: PathSpec, volume: str = None) -> 'FileIndex':
+        """ Build the index from the MFT of an NTFS partition """
+        if volume is None:
+            volume = volume_identity(partition)
+        index = cls(partition, read_mft(partition), volume)
+        LOGGER.info("Indexed %d paths of %s", len(index), partition.comparable)
+        return index
+
+    @classmethod
+    def load(cls, path: str, partition: PathSpec, volume: str) -> Optional['FileIndex']:
+        """ Load a persisted index, None if it does not exist or belongs to another partition or volume """
+        if not os.path.exists(path):
+            return None
+        connection = sqlite3.connect(path)
+        try:
+            info = connection.execute("SELECT partition, volume FROM file_index_info").fetchone()
+            if not info or info[0] != partition.comparable:
+                LOGGER.info("File index %s belongs to another partition", path)
+                return None
+            if info[1] != volume:
+                LOGGER.info("File index %s belongs to another volume", path)
+                return None
+            rows = connection.execute("SELECT path, entry, is_directory FROM file_index")
+            return cls(partition, ((path, entry, bool(is_directory)) for path, entry, is_directory in rows), volume)
+        except sqlite3.DatabaseError as err:
+            LOGGER.warning("Cannot read file index %s: %s", path, err)
+            return None
+        finally:
+            connection.close()
+
+    def save(self, path: str):
+        """ Persist the index to an SQLite file """
+        connection = sqlite3.connect(path)
+        try:
+            with connection:
+                for query in SCHEMA:
+                    connection.execute(query)
+                connection.execute("INSERT INTO file_index_info (partition, volume) VALUES (?, ?)",
+                                   (self.partition.comparable, self.volume))
+                connection.executemany(
+                    "INSERT OR IGNORE INTO file_index (folded, path, entry, is_directory) VALUES (?, ?, ?, ?)",
+                    zip(self.folded, self.paths, self.entries, self.is_directory))
+        finally:
+            connection.close()
+
+    @classmethod
+    def for_partition(cls, partinfo: PartitionInfo, index_dir: str = None) -> Optional['FileIndex']:
+        """
+        Get the index of a partition, loaded from index_dir if it was persisted there
+        before and built and persisted otherwise
+        :return: FileIndex or None if the partition is not NTFS or its MFT cannot be read
+        """
+        if not cls.supports(partinfo.path_spec):
+            LOGGER.info("No NTFS file system on partition %s, not indexing it", partinfo.name)
+            return None
+
+        path = os.path.join(index_dir, partinfo.name + INDEX_EXTENSION) if index_dir else None
+        try:
+            volume = volume_identity(partinfo.path_spec)
+            if path:
+                index = cls.load(path, partinfo.path_spec, volume)
+                if index is not None:
+                    LOGGER.info("Loaded %d indexed paths from %s", len(index), path)
+                    return index
+            index = cls.build(partinfo.path_spec, volume)
+        except (IOError, dfvfs_errors.Error) as err:
+            LOGGER.warning("Cannot index partition %s, globbing without index: %s", partinfo.name, err)
+            return None
+        if path:
+            os.makedirs(index_dir, exist_ok=True)
+            index.save(path)
+        return index
+
+    def _range(self, prefix: str) -> Tuple[int, int]:
+        """ index range of all paths below a case folded directory path """
+        # '0' directly follows '/', so this range holds exactly the paths starting with prefix + '/'
+        return bisect_left(self.folded, prefix + '/'), bisect_left(self.folded, prefix + '0')
+
+    def path_spec(self, position: int) -> PathSpec:
+        """ Create the dfVFS path spec of an index entry """
+        partition = self.partition
+        if partition.type_indicator == dfvfs_defs.TYPE_INDICATOR_NTFS:
+            return path_spec_factory.Factory.NewPathSpec(
+                partition.type_indicator, location=self.paths[position].replace('/', '\\'),
+                mft_entry=self.entries[position], parent=partition.parent)
+        return path_spec_factory.Factory.NewPathSpec(
+            partition.type_indicator, location=self.paths[position],
+            inode=self.entries[position], parent=partition.parent)
+
+    def glob(self, patterns: Iterable[str]) -> List[PathSpec]:
+        """
+        Resolve case insensitive, '/' separated globs with superglobs
+        :return: List[PathSpec] of the matching entries
+        """
+        positions = set()
+        for pattern in patterns:
+            folded = '/' + '/'.join(segment for segment in pattern.casefold().split('/') if segment)
+            segments = folded.split('/')[1:]
+            prefix = literal_prefix(segments)
+
+            if len(prefix) == len(segments):
+                start = bisect_left(self.folded, folded)
+                while start < len(self.folded) and self.folded[start] == folded:
+                    positions.add(start)
+                    start += 1
+                continue
+
+            regex = re.compile(glob_to_regex(folded))
+            start, end = self._range('/' + '/'.join(prefix) if prefix else '')
+            positions.update(position for position in range(start, end) if regex.fullmatch(self.folded[position]))
+
+        return [self.path_spec(position) for position in sorted(positions)]
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# Copyright (c) 2020 Siemens AG
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Resolve many file globs with a single walk over a partition. The globs are
+compiled into a prefix trie of path segments, so every directory on the way
+is only listed once, no matter how many globs pass through it. Listings come
+from the directory cache of DFVFSHelper.
+"""
+
+from collections import defaultdict
+from typing import Dict, Iterable, List, Pattern, Tuple
+
+from dfvfs.path.path_spec import PathSpec
+from dfvfs_helper import glob_segment_regex, is_glob_segment
+
+
+def split_path(path: str) -> List[str]:
+    """ split a path into its segments, ignoring empty ones """
+    return [segment for segment in path.split('/') if segment]
+
+
+class _GlobNode(object):  # pylint: disable=too-few-public-methods
+    """ a path segment in the glob trie """
+
+    __slots__ = ('literals', 'wildcards', 'patterns')
+
+    def __init__(self):
+        # case folded segment -> node
+        self.literals: Dict[str, '_GlobNode'] = {}
+        # case folded wildcard segment -> (compiled segment, node)
+        self.wildcards: Dict[str, Tuple[Pattern, '_GlobNode']] = {}
+        # globs that end in this node
+        self.patterns: List[str] = []
+
+    def has_children(self) -> bool:
+        """ check if the walk has to go deeper below this node """
+        return bool(self.literals or self.wildcards)
+
+
+class GlobPlanner(object):
+    """
+    Collects file globs (case insensitive, '/' separated, wildcards and
+    character classes, no superglobs) and matches all of them in one walk
+    """
+
+    def __init__(self):
+        self.root = _GlobNode()
+        self.patterns = set()
+
+    def add(self, patterns: Iterable[str]):
+        """ Add globs to the trie """
+        for pattern in patterns:
+            if pattern in self.patterns:
+                continue
+            self.patterns.add(pattern)
+            node = self.root
+            for segment in split_path(pattern):
+                folded = segment.casefold()
+                if is_glob_segment(segment):
+                    if folded not in node.wildcards:
+                        node.wildcards[folded] = (glob_segment_regex(segment), _GlobNode())
+                    node = node.wildcards[folded][1]
+                else:
+                    node = node.literals.setdefault(folded, _GlobNode())
+            node.patterns.append(pattern)
+
+    def match(self, helper, partition) -> Dict[str, List[PathSpec]]:
+        """
+        Walk the partition once through the directory cache of its helper
+        :param helper: DFVFSHelper of the partition
+        :param partition: PathSpec of the partition
+        :return: Dict of glob -> List[PathSpec] of the matching entries
+        """
+        matches = defaultdict(list)
+        stack = [('', [self.root])]
+        while stack:
+            path, nodes = stack.pop()
+            listing = helper.list_directory(path, partition)
+            if not listing:
+                continue
+
+            # directories that are only passed by name are not iterated
+            if any(node.wildcards for node in nodes):
+                candidates = [(folded, entry) for folded, entries in listing.items() for entry in entries]
+            else:
+                candidates = [(folded, entry) for folded in {folded for node in nodes for folded in node.literals}
+                              for entry in listing.get(folded, [])]
+
+            # directories whose names only differ in case share one listing
+            descended = set()
+            for folded, entry in candidates:
+                next_nodes = []
+                for node in nodes:
+                    literal = node.literals.get(folded)
+                    if literal:
+                        next_nodes.append(literal)
+                    for regex, wildcard in node.wildcards.values():
+                        if regex.fullmatch(entry.name):
+                            next_nodes.append(wildcard)
+
+                for node in next_nodes:
+                    for pattern in node.patterns:
+                        matches[pattern].append(entry.path_spec)
+
+                next_nodes = [node for node in next_nodes if node.has_children()]
+                if next_nodes and entry.is_directory and folded not in descended:
+                    descended.add(folded)
+                    stack.append((path + '/' + entry.name, next_nodes))
+
+        return matches
@@ -76,6 +76,25 @@ def parse_args():
         dest="input_evidence_dir",
         help="Input folder root path. If given, --input-file is relative to this"
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        dest="workers",
+        help="Number of partitions processed in parallel worker processes"
+    )
+    parser.add_argument(
+        "--file-index",
+        dest="file_index",
+        action="store_true",
+        help="Index NTFS partitions by reading their MFT once and answer file globs from the index"
+    )
+    parser.add_argument(
+        "--file-index-dir",
+        dest="file_index_dir",
+        help="Folder to persist file indexes to and load them from, implies --file-index"
+    )
     parser.add_argument('-v', '--verbose', action='count', default=0)
     my_args, _ = parser.parse_known_args(sys.argv[1:])
 
@@ -153,11 +172,12 @@ class ArtifactExtractionCommand:
         try:
             handler = encryption_handlers.ConsoleEncryptionHandler(encryption_keys)
             extractor = ArtifactExtractor(self.args.input_evidence, store,
-                                          self.artifact_registry, handler, self.args.zip_mode)
+                                          self.artifact_registry, handler, self.args.zip_mode, self.args.workers,
+                                          self.args.file_index or bool(self.args.file_index_dir),
+                                          self.args.file_index_dir)
             to_extract = [a.strip() for a in self.args.artifact_names.split(',')]
-            for artifact in to_extract:
-                print("Extract %s" % artifact)
-                extractor.extract_artifact(artifact)
+            print("Extract %s" % ", ".join(to_extract))
+            extractor.extract_artifacts(to_extract)
         except Exception as error:
             LOGGER.exception("Uncaught exception during job: %s", error)
         finally:
@@ -0,0 +1,61 @@
+# Copyright (c) 2020 Siemens AG
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+
+import forensicstore
+import pytest
+
+pytest.importorskip("dfvfs")
+pytest.importorskip("pyartifacts")
+from artifact_collector import merge_store  # noqa: E402 pylint: disable=wrong-import-position
+
+
+@pytest.fixture
+def tmp():
+    tmpdir = tempfile.mkdtemp()
+    yield tmpdir
+    shutil.rmtree(tmpdir)
+
+
+def new_worker_store(path):
+    worker = forensicstore.new(path)
+    element_id = worker.add_file_element("WindowsEventLogs", "System.evtx", None, None, None, origin={}, errors=None)
+    with worker.add_file_element_export(element_id) as dest:
+        dest.write(b"ElfFile")
+    worker.insert({"type": "directory", "artifact": "WindowsEventLogs", "path": "/Windows/System32/winevt/Logs"})
+    worker.close()
+
+
+def test_merge_store(tmp):
+    worker_paths = [os.path.join(tmp, name + ".forensicstore") for name in ("c", "d")]
+    store = forensicstore.new(os.path.join(tmp, "input.forensicstore"))
+    for worker_path in worker_paths:
+        new_worker_store(worker_path)
+        merge_store(store, worker_path)
+
+    files = list(store.select([{"type": "file"}]))
+    assert len(files) == 2 and len(list(store.select([{"type": "directory"}]))) == 2
+    # the file of the second partition gets its own export path
+    assert files[0]["export_path"] != files[1]["export_path"]
+    for item in files:
+        with store.load_file(item["export_path"]) as src:
+            assert src.read() == b"ElfFile"
+    store.close()
+
+    # the worker stores are closed again and can be removed
+    for worker_path in worker_paths:
+        os.remove(worker_path)
@@ -0,0 +1,124 @@
+# Copyright (c) 2020 Siemens AG
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict, namedtuple
+
+import pytest
+
+pytest.importorskip("dfvfs")
+pytest.importorskip("pybde")
+from dfvfs.lib import errors as dfvfs_errors  # noqa: E402 pylint: disable=wrong-import-position
+from dfvfs.resolver import resolver  # noqa: E402 pylint: disable=wrong-import-position
+from dfvfs_helper import DFVFSHelper  # noqa: E402 pylint: disable=wrong-import-position
+
+
+class FakePathSpec(namedtuple('FakePathSpec', ['partition', 'location'])):
+    """ path spec of a partition with an empty location, or of an entry on it """
+
+    @property
+    def comparable(self):
+        return self.partition + ':' + self.location
+
+
+class FakeFileEntry(object):
+    """ file entry of a directory tree """
+
+    def __init__(self, path_spec, tree):
+        self.name = path_spec.location.rsplit('/', 1)[-1]
+        self.path_spec = path_spec
+        self.tree = tree
+
+    def IsDirectory(self):  # pylint: disable=invalid-name
+        return self.tree is not None
+
+    @property
+    def sub_file_entries(self):
+        for name, subtree in (self.tree or {}).items():
+            path_spec = FakePathSpec(self.path_spec.partition, self.path_spec.location + '/' + name)
+            yield FakeFileEntry(path_spec, subtree)
+
+
+def new_helper(partitions):
+    """ helper without an image, for the partitions a dict of tree or exception to raise on open """
+    helper = DFVFSHelper.__new__(DFVFSHelper)
+    helper._directory_cache = OrderedDict()  # pylint: disable=protected-access
+    helper._directory_cache_size = 16  # pylint: disable=protected-access
+    helper.base_path_specs = [FakePathSpec(name, '') for name in partitions]
+
+    def open_file_entry(path_spec, resolver_context=None):  # pylint: disable=unused-argument
+        tree = partitions[path_spec.partition]
+        if isinstance(tree, Exception):
+            raise tree
+        for segment in path_spec.location.split('/')[1:]:
+            tree = tree[segment]
+        return FakeFileEntry(path_spec, tree)
+
+    return helper, open_file_entry
+
+
+def test_list_directory_open_error(monkeypatch):
+    helper, open_file_entry = new_helper({
+        'broken': dfvfs_errors.BackEndError('unable to open'),
+        'ntfs': {'Windows': {'System32': {'config': {'SAM': None}}}},
+    })
+    monkeypatch.setattr(resolver.Resolver, 'OpenFileEntry', open_file_entry)
+    broken, ntfs = helper.base_path_specs
+
+    assert helper.list_directory('', broken) is None
+    assert helper.list_directory('/Windows', broken) is None
+    assert list(helper.find_paths(['/windows/system32/config/*'])) == [
+        FakePathSpec('ntfs', '/Windows/System32/config/SAM')]
+    assert helper.list_directory('/windows', ntfs)['system32'][0].is_directory
+    # the failed open is cached
+    assert ('broken:', '') in helper._directory_cache  # pylint: disable=protected-access
+
+
+def test_list_directory_sub_entry_error(monkeypatch):
+    helper, open_file_entry = new_helper({'ntfs': {'Windows': {'System32': {}}}})
+
+    def open_sub_entry(path_spec, resolver_context=None):
+        if path_spec.location == '/Windows':
+            raise dfvfs_errors.BackEndError('unable to open')
+        return open_file_entry(path_spec, resolver_context)
+
+    monkeypatch.setattr(resolver.Resolver, 'OpenFileEntry', open_sub_entry)
+
+    assert list(helper.list_directory('')) == ['windows']
+    assert helper.list_directory('/Windows') is None
+    assert helper.list_directory('/Windows/System32') is None
+    assert not list(helper.find_paths(['/Windows/*']))
+
+
+def test_names_differing_in_case(monkeypatch):
+    helper, open_file_entry = new_helper({'ext': {
+        'Docs': {'README': None, 'notes': None},
+        'docs': {'readme': None},
+    }})
+    monkeypatch.setattr(resolver.Resolver, 'OpenFileEntry', open_file_entry)
+    ext, = helper.base_path_specs
+
+    assert sorted(entry.name for entry in helper.list_directory('/DOCS')['readme']) == ['README', 'readme']
+    assert sorted(path_spec.location for path_spec in helper.find_paths(['/docs/*'])) == [
+        '/Docs/README', '/Docs/notes', '/docs/readme']
+    assert [path_spec.location for path_spec in helper.find_paths(['/docs/readme'])] == [
+        '/Docs/README', '/docs/readme']
+
+    found = [file_entry.path_spec.location for file_entry in helper.find_filename(['readme'], case_sensitive=True)]
+    assert found == ['/docs/readme']
+    found = sorted(file_entry.path_spec.location for file_entry in helper.find_filename(['README']))
+    assert found == ['/Docs/README', '/docs/readme']
+    # the full walk starts at the partition root and leaves the directory cache alone
+    cached = list(helper._directory_cache)  # pylint: disable=protected-access
+    assert [file_entry.path_spec for file_entry in helper.find_filename(['.*'], regex=True)][0] == ext
+    assert list(helper._directory_cache) == cached  # pylint: disable=protected-access
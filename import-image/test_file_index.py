@@ -0,0 +1,146 @@
+# Copyright (c) 2020 Siemens AG
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+
+import pytest
+
+pytest.importorskip("dfvfs")
+pytest.importorskip("pyfsntfs")
+import dfvfs.lib.definitions as dfvfs_defs  # noqa: E402 pylint: disable=wrong-import-position
+from dfvfs.path import factory as path_spec_factory  # noqa: E402 pylint: disable=wrong-import-position
+from file_index import FileIndex, glob_to_regex  # noqa: E402 pylint: disable=wrong-import-position
+
+ROWS = [
+    ("/Windows", 30, True),
+    ("/Windows/System32", 31, True),
+    ("/Windows/System32/config", 32, True),
+    ("/Windows/System32/config/SAM", 33, False),
+    ("/Windows/System32/config/SYSTEM", 34, False),
+    ("/Windows/System32/config/RegBack", 35, True),
+    ("/Windows/System32/config/RegBack/SYSTEM", 36, False),
+    ("/Windows/System32/winevt/Logs/System.evtx", 37, False),
+    ("/Users", 40, True),
+    ("/Users/bob/NTUSER.DAT", 41, False),
+    ("/Users/bob/AppData/Local/Microsoft/Windows/UsrClass.dat", 42, False),
+    ("/Users/bob/Desktop/link.lnk", 43, False),
+    ("/Users/bob/Documents/link.lnk", 43, False),
+    ("/Users0/other", 44, False),
+]
+
+VOLUME = "0123456789abcdef:1024"
+
+
+def new_partition(image="/images/disk.raw"):
+    image_spec = path_spec_factory.Factory.NewPathSpec(dfvfs_defs.TYPE_INDICATOR_OS, location=image)
+    return path_spec_factory.Factory.NewPathSpec(dfvfs_defs.TYPE_INDICATOR_TSK, location='/', parent=image_spec)
+
+
+def glob(index, patterns):
+    return [path_spec.location for path_spec in index.glob(patterns)]
+
+
+@pytest.fixture
+def tmp():
+    tmpdir = tempfile.mkdtemp()
+    yield tmpdir
+    shutil.rmtree(tmpdir)
+
+
+@pytest.mark.parametrize("pattern, matches, mismatches", [
+    ("/windows/**", ["/windows/a", "/windows/a/b/c"], ["/windows", "/windowsx/a"]),
+    ("/windows/**/sam", ["/windows/a/sam", "/windows/a/b/sam"], ["/windows/sam", "/windows/a/sam/x"]),
+    ("/windows/**2", ["/windows/a", "/windows/a/b"], ["/windows/a/b/c"]),
+    ("/windows/**1/sam", ["/windows/a/sam"], ["/windows/a/b/sam"]),
+    ("/windows/*", ["/windows/a", "/windows/"], ["/windows/a/b"]),
+    ("/a?c", ["/abc"], ["/a/c", "/ac"]),
+    ("/a.b+(c)$", ["/a.b+(c)$"], ["/axb+(c)$", "/a.bb(c)$"]),
+    ("/[ab]c", ["/ac", "/bc"], ["/cc", "/[ab]c"]),
+    ("/[!a]c", ["/bc"], ["/ac", "//c"]),
+    ("/[]a]c", ["/]c", "/ac"], ["/bc"]),
+    ("/[^a]c", ["/^c", "/ac"], ["/bc"]),
+    ("/[a", ["/[a"], ["/a"]),
+])
+def test_glob_to_regex(pattern, matches, mismatches):
+    regex = re.compile(glob_to_regex(pattern))
+
+    assert all(regex.fullmatch(path) for path in matches)
+    assert not any(regex.fullmatch(path) for path in mismatches)
+
+
+def test_glob():
+    index = FileIndex(new_partition(), ROWS, VOLUME)
+
+    assert len(index) == len(ROWS)
+    assert glob(index, ["windows/system32/CONFIG/sam"]) == ["/Windows/System32/config/SAM"]
+    assert glob(index, ["/WINDOWS/System32/config/S*"]) == [
+        "/Windows/System32/config/SAM", "/Windows/System32/config/SYSTEM"]
+    assert glob(index, ["/Windows/**/SYSTEM"]) == [
+        "/Windows/System32/config/RegBack/SYSTEM", "/Windows/System32/config/SYSTEM"]
+    assert glob(index, ["/Windows/**2/SYSTEM"]) == ["/Windows/System32/config/SYSTEM"]
+    assert glob(index, ["/Users/*/*/link.lnk", "/users/bob/desktop/LINK.lnk"]) == [
+        "/Users/bob/Desktop/link.lnk", "/Users/bob/Documents/link.lnk"]
+    assert glob(index, ["/Users/**"]) == [
+        "/Users/bob/AppData/Local/Microsoft/Windows/UsrClass.dat", "/Users/bob/Desktop/link.lnk",
+        "/Users/bob/Documents/link.lnk", "/Users/bob/NTUSER.DAT"]
+    assert glob(index, ["/Windows/System32/config/[rs]*"]) == [
+        "/Windows/System32/config/RegBack", "/Windows/System32/config/SAM", "/Windows/System32/config/SYSTEM"]
+    assert glob(index, ["/Missing/*", "/Windows/System32/config/missing"]) == []
+
+
+def test_save_load(tmp):
+    partition = new_partition()
+    path = os.path.join(tmp, "p1.fileindex")
+
+    FileIndex(partition, ROWS, VOLUME).save(path)
+    index = FileIndex.load(path, partition, VOLUME)
+
+    assert index.volume == VOLUME
+    assert list(zip(index.paths, index.entries, index.is_directory)) == sorted(
+        ROWS, key=lambda row: row[0].casefold())
+    assert glob(index, ["/Users/*/NTUSER.DAT"]) == ["/Users/bob/NTUSER.DAT"]
+
+    # saving again replaces the index
+    FileIndex(partition, ROWS[:2], VOLUME).save(path)
+    assert len(FileIndex.load(path, partition, VOLUME)) == 2
+
+
+def test_load_other_volume(tmp):
+    partition = new_partition()
+    path = os.path.join(tmp, "p1.fileindex")
+    FileIndex(partition, ROWS, VOLUME).save(path)
+
+    assert FileIndex.load(os.path.join(tmp, "missing.fileindex"), partition, VOLUME) is None
+    assert FileIndex.load(path, new_partition("/images/other.raw"), VOLUME) is None
+    # a different volume or a grown MFT on the same image path
+    assert FileIndex.load(path, partition, "fedcba9876543210:1024") is None
+    assert FileIndex.load(path, partition, "0123456789abcdef:2048") is None
+
+
+def test_load_without_volume(tmp):
+    partition = new_partition()
+    path = os.path.join(tmp, "p1.fileindex")
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute("CREATE TABLE file_index_info (partition TEXT NOT NULL)")
+        connection.execute("INSERT INTO file_index_info (partition) VALUES (?)", (partition.comparable,))
+    connection.close()
+
+    assert FileIndex.load(path, partition, VOLUME) is None
+    FileIndex(partition, ROWS, VOLUME).save(path)
+    assert len(FileIndex.load(path, partition, VOLUME)) == len(ROWS)
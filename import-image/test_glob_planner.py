@@ -0,0 +1,114 @@
+# Copyright (c) 2020 Siemens AG
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+pytest.importorskip("dfvfs")
+pytest.importorskip("pybde")
+from dfvfs_helper import DFVFSHelper, DirectoryEntry  # noqa: E402 pylint: disable=wrong-import-position
+from glob_planner import GlobPlanner  # noqa: E402 pylint: disable=wrong-import-position
+
+FILES = [
+    "/Windows/System32/config/SAM",
+    "/Windows/System32/config/SYSTEM",
+    "/Windows/System32/config/sam",
+    "/Windows/System32/drivers/etc/hosts",
+    "/Windows/System32/winevt/Logs/Security.evtx",
+    "/Windows/System32/winevt/Logs/System.evtx",
+    "/Windows/Prefetch/CMD.EXE-1234ABCD.pf",
+    "/Windows/Prefetch/calc.exe-5678ABCD.pf",
+    "/Windows/Prefetch/Layout.ini",
+    "/Users/alice/NTUSER.DAT",
+    "/Users/bob/ntuser.dat",
+    "/Users/bob/AppData/Local/Microsoft/Windows/UsrClass.dat",
+    "/Users/[bracket]/NTUSER.DAT",
+]
+
+GLOBS = [
+    "/Windows/System32/config/SAM",
+    "/windows/system32/CONFIG/*",
+    "/Windows/System32/config/SA[MN]",
+    "/Windows/System32/winevt/Logs/*.evtx",
+    "/Windows/Prefetch/*.pf",
+    "/Windows/Prefetch/[a-c]*-????????.pf",
+    "/Windows/Prefetch/[!c]*",
+    "/Users/*/NTUSER.DAT",
+    "/Users/*/AppData/Local/Microsoft/Windows/UsrClass.dat",
+    "/Users/[bracket/NTUSER.DAT",
+    "/Missing/*",
+]
+
+
+class FakeHelper(object):
+    """ directory listings of FILES, path specs are the paths """
+
+    _glob_cached = DFVFSHelper._glob_cached  # pylint: disable=protected-access
+
+    def __init__(self, files):
+        self.listed = []
+        self.listings = {}
+        for path in files:
+            segments = path.split('/')[1:]
+            for depth, name in enumerate(segments):
+                parent = '/'.join(segment.casefold() for segment in segments[:depth])
+                self.listings.setdefault(parent, {}).setdefault(name.casefold(), {})[name] = DirectoryEntry(
+                    name, '/' + '/'.join(segments[:depth + 1]), depth < len(segments) - 1)
+
+    def list_directory(self, path, partition=None):  # pylint: disable=unused-argument
+        self.listed.append(path.casefold())
+        listing = self.listings.get('/'.join(segment.casefold() for segment in path.split('/') if segment))
+        if listing is None:
+            return None
+        return {folded: list(entries.values()) for folded, entries in listing.items()}
+
+
+def test_planner_matches_per_artifact_globbing():
+    helper = FakeHelper(FILES)
+    planner = GlobPlanner()
+    planner.add(GLOBS)
+
+    matches = planner.match(helper, None)
+
+    for glob in GLOBS:
+        assert sorted(matches.get(glob, [])) == sorted(helper._glob_cached(glob, None)), glob
+
+
+def test_planner_character_classes():
+    planner = GlobPlanner()
+    planner.add(GLOBS)
+
+    matches = planner.match(FakeHelper(FILES), None)
+
+    assert sorted(matches["/Windows/System32/config/SA[MN]"]) == [
+        "/Windows/System32/config/SAM", "/Windows/System32/config/sam"]
+    assert sorted(matches["/Windows/Prefetch/[a-c]*-????????.pf"]) == [
+        "/Windows/Prefetch/CMD.EXE-1234ABCD.pf", "/Windows/Prefetch/calc.exe-5678ABCD.pf"]
+    assert matches["/Windows/Prefetch/[!c]*"] == ["/Windows/Prefetch/Layout.ini"]
+    # an unclosed bracket is a literal
+    assert matches["/Users/[bracket/NTUSER.DAT"] == []
+    assert "/Missing/*" not in matches
+
+
+def test_planner_lists_directories_once():
+    helper = FakeHelper(FILES)
+    planner = GlobPlanner()
+    planner.add(GLOBS)
+
+    planner.match(helper, None)
+
+    assert len(helper.listed) == len(set(helper.listed))
+    # the walk only descends into directories that a glob passes through
+    assert "/windows/system32/winevt" in helper.listed
+    assert "/users/bob/appdata/local" in helper.listed
+    assert "/windows/system32/drivers" not in helper.listed
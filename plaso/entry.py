@@ -16,16 +16,51 @@
 # Author(s): Jonas Plum
 
 import argparse
+import contextlib
+import datetime
 import logging
 import os
+import shutil
+import sqlite3
 import subprocess
 import sys
 import tempfile
+import time
 
 import forensicstore
 
 LOGGER = logging.getLogger(__name__)
 
+STORE_PATH = "/input/input.forensicstore"
+# Intermediate storage of the extracted events, psort reads it back to write
+# them to the store, with or without --in-process
+PLASO_STORAGE = "Plaso/events.plaso"
+LOG_DIR = "Plaso"
+# Artifact of the plaso log files added to the store, they are never timelined
+LOG_ARTIFACT = "PlasoLogs"
+
+# Parsers for the files of an artifact, the files of other artifacts are
+# parsed with plaso's default parsers
+ARTIFACT_PARSERS = {
+    "WindowsEventLogs": "winevt,winevtx",
+    "WindowsXMLEventLogFiles": "winevtx",
+    "WindowsRegistryFilesAndTransactionLogs": "winreg",
+    "WindowsSystemRegistryFiles": "winreg",
+    "WindowsUserRegistryFiles": "winreg",
+    "WindowsAMCacheHveFile": "winreg",
+    "WindowsPrefetchFiles": "prefetch",
+    "WindowsRecycleBin": "recycle_bin,recycle_bin_info2",
+    "WindowsLNKFiles": "lnk",
+    "WindowsScheduledTasks": "winjob",
+}
+DEFAULT_PARSERS = ""
+
+# Files that have already been timelined, by element id and content hash
+LEDGER_QUERY = "CREATE TABLE IF NOT EXISTS plaso_ledger (id TEXT NOT NULL, hash TEXT NOT NULL, PRIMARY KEY (id, hash))"
+
+# Buffer size for copying files out of the store
+COPY_BUFFER_SIZE = 16 * 1024 * 1024
+
 
 class StoreDictKeyPair(argparse.Action):
     # pylint: disable=too-few-public-methods
@@ -44,40 +79,202 @@ class StoreDictKeyPair(argparse.Action):
         setattr(namespace, self.dest, [new_dict])
 
 
+def stage_file(store, export_path, dst_path):
+    """ Copy a store file to dst_path for plaso, in chunks so large files are not read into memory """
+    with store.load_file(export_path) as src, open(dst_path, "wb") as dest:
+        shutil.copyfileobj(src, dest, COPY_BUFFER_SIZE)
+
+
+def file_hash(item):
+    """ Return the hash identifying the content of a file element """
+    hashes = item.get("hashes", {})
+    for name in ("SHA-256", "SHA-1", "MD5"):
+        if name in hashes:
+            return hashes[name]
+    return "%s:%s" % (item["export_path"], item.get("size", ""))
+
+
+def read_ledger(store):
+    """ Return the hash each file element had when it was timelined, by element id """
+    with store.connection:
+        store.connection.execute(LEDGER_QUERY)
+    return {row[0]: row[1] for row in store.connection.execute("SELECT id, hash FROM plaso_ledger")}
+
+
+def write_ledger(store, entries):
+    """ Record files as timelined, replacing earlier versions of them """
+    with store.connection:
+        store.connection.execute(LEDGER_QUERY)
+        store.connection.executemany("DELETE FROM plaso_ledger WHERE id = ?", [(item_id,) for item_id, _ in entries])
+        store.connection.executemany("INSERT INTO plaso_ledger (id, hash) VALUES (?, ?)", entries)
+
+
+def remove_events(store, export_path):
+    """ Remove the events of an earlier version of a file """
+    try:
+        with store.connection:
+            store.connection.execute(
+                "DELETE FROM elements WHERE id IN (SELECT id FROM plaso_events WHERE export_path = ?)",
+                (export_path.strip("/"),))
+            store.connection.execute("DELETE FROM plaso_events WHERE export_path = ?", (export_path.strip("/"),))
+    except sqlite3.OperationalError:
+        # no events were written yet
+        pass
+
+
+@contextlib.contextmanager
+def timed(report, stage):
+    """ Add the wall time of a pipeline stage to the report """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        report["stages"][stage] = report["stages"].get(stage, 0) + time.perf_counter() - start
+
+
+def store_log(store, path):
+    """ Add a plaso log file to the store as a file element """
+    modified = datetime.datetime.utcfromtimestamp(os.path.getmtime(path))
+    element_id = store.add_file_element(LOG_ARTIFACT, os.path.basename(path), modified, modified, modified,
+                                        origin={"path": path}, errors=None)
+    with store.add_file_element_export(element_id) as dest, open(path, "rb") as src:
+        shutil.copyfileobj(src, dest, COPY_BUFFER_SIZE)
+
+
+def run_tool(name, arguments, in_process=False):
+    """
+    Run log2timeline or psort, either as a subprocess or in this interpreter
+    through plaso's tool classes, which saves the interpreter and plaso
+    import startup of every run. Either way the events pass through
+    PLASO_STORAGE, log2timeline writes it and psort reads it back.
+    """
+    if not in_process:
+        subprocess.run([name + ".py"] + arguments, check=True)
+        return
+
+    if name == "log2timeline":
+        from plaso.cli import log2timeline_tool
+        tool = log2timeline_tool.Log2TimelineTool()
+        run = tool.ExtractEventsFromSources
+    else:
+        from plaso.cli import psort_tool
+        tool = psort_tool.PsortTool()
+        run = tool.ProcessStorage
+
+    if not tool.ParseArguments(arguments):
+        raise RuntimeError("invalid %s arguments: %s" % (name, " ".join(arguments)))
+    run()
+
+
 def main():
     parser = argparse.ArgumentParser(description='parse key pairs into a dictionary')
     parser.add_argument("--filter", dest="filter", action=StoreDictKeyPair, metavar="type=file,name=System.evtx...")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="number of plaso worker processes, 0 lets plaso choose based on the CPU count")
+    parser.add_argument("--in-process", dest="in_process", action="store_true",
+                        help="run log2timeline and psort in this process instead of as subprocesses, "
+                             "the events are still written to and read back from " + PLASO_STORAGE)
+    parser.add_argument("--start", help="only write events at or after this UTC time (YYYY-MM-DD[THH:MM:SS])")
+    parser.add_argument("--end", help="only write events at or before this UTC time (YYYY-MM-DD[THH:MM:SS])")
+    parser.add_argument("--data-types", dest="data_types",
+                        help="comma separated event data types to write, e.g. windows:evtx:record")
+    parser.add_argument("--parsers", help="comma separated parsers whose events are written, e.g. winevtx")
     args, _ = parser.parse_known_args(sys.argv[1:])
 
     if args.filter is None:
         args.filter = [{"type": "file"}]
 
-    store = forensicstore.open("/input/input.forensicstore")
-    files = []
+    output_filters = ""
+    if args.start or args.end or args.data_types or args.parsers:
+        output_filters = "|" + "|".join(value or "" for value in (args.start, args.end, args.data_types, args.parsers))
+
+    store = forensicstore.open(STORE_PATH)
+    groups = {}
+    runs = {}
+    timelined = []
+    logs = []
+    report = {"type": "plaso-report", "stages": {}, "runs": [], "files": 0, "bytes_staged": 0}
+
+    # the store keeps its files inside the database, so they are copied to
+    # the staging directory, never written into the input directory
+    with tempfile.TemporaryDirectory() as tmpdir:
+        try:
+            ledger = read_ledger(store)
+            with timed(report, "export"):
+                selected = list(store.select(args.filter))
+            for item in selected:
+                if "export_path" not in item or item.get("artifact") == LOG_ARTIFACT:
+                    continue
+
+                # only new and changed files are timelined, files written with
+                # other output filters count as changed
+                digest = file_hash(item) + output_filters
+                if ledger.get(item["id"]) == digest:
+                    continue
+                if item["id"] in ledger:
+                    remove_events(store, item["export_path"])
+
+                # files are staged in one directory per parser set
+                parsers = ARTIFACT_PARSERS.get(item.get("artifact"), DEFAULT_PARSERS)
+                group_dir = groups.setdefault(parsers, os.path.join(tmpdir, parsers.replace(",", "_") or "default"))
+                dst_path = os.path.join(group_dir, item["export_path"].strip("/"))
+                os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+                with timed(report, "export"):
+                    stage_file(store, item["export_path"], dst_path)
+                timelined.append((item["id"], digest))
+
+                run = runs.setdefault(parsers, {"parsers": parsers or "default", "files": 0, "bytes": 0})
+                run["files"] += 1
+                run["bytes"] += os.path.getsize(dst_path)
+        finally:
+            store.close()
 
-    tmpdir = tempfile.mkdtemp()
+        if not groups:
+            LOGGER.warning("No new files selected")
+            return
 
-    selected = list(store.select(args.filter))
-    for item in selected:
-        if "export_path" in item:
-            dst_path = os.path.join(tmpdir, item["export_path"].strip("/"))
-            os.makedirs(os.path.dirname(dst_path), exist_ok=True)
-            with store.load_file(item["export_path"]) as src, open(dst_path, "wb") as dest:
-                dest.write(src.read())
-                files.append(dst_path)
-    store.close()
+        # the storage of an earlier run would be appended to and its events
+        # written again
+        os.makedirs("Plaso", exist_ok=True)
+        if os.path.exists(PLASO_STORAGE):
+            os.remove(PLASO_STORAGE)
 
-    os.makedirs("Plaso", exist_ok=True)
-    for file in files:
-        subprocess.run(
-            ["log2timeline.py", "--status_view", "none", "--logfile", "test.log", "Plaso/events.plaso", file],
-            check=True)
+        # one run per parser set, plaso spreads the files of a run over its
+        # worker processes
+        for i, (parsers, group_dir) in enumerate(sorted(groups.items())):
+            logs.append(os.path.join(LOG_DIR, "log2timeline_%d.log" % i))
+            arguments = ["--status_view", "none", "--logfile", logs[-1], "--workers", str(args.workers)]
+            if parsers:
+                arguments += ["--parsers", parsers]
+            start = time.perf_counter()
+            with timed(report, "log2timeline"):
+                run_tool("log2timeline", arguments + [PLASO_STORAGE, group_dir], args.in_process)
+            runs[parsers]["seconds"] = time.perf_counter() - start
+            report["runs"].append(runs[parsers])
+            report["files"] += runs[parsers]["files"]
+            report["bytes_staged"] += runs[parsers]["bytes"]
 
-    # TODO: add logfile to forensicstore
+    # the output module adds a plaso-statistics element with the events per parser
+    logs.append(os.path.join(LOG_DIR, "psort.log"))
+    arguments = ["--status_view", "none", "--logfile", logs[-1], "-o", "forensicstore", "-w", STORE_PATH,
+                 "--forensicstore_source_roots", ",".join(sorted(groups.values()))]
+    for option, value in [("--forensicstore_start", args.start), ("--forensicstore_end", args.end),
+                          ("--forensicstore_data_types", args.data_types),
+                          ("--forensicstore_parsers", args.parsers)]:
+        if value:
+            arguments += [option, value]
+    with timed(report, "psort"):
+        run_tool("psort", arguments + [PLASO_STORAGE], args.in_process)
 
-    subprocess.run(
-        ["psort.py", "--status_view", "none", "-o", "forensicstore",
-         "-w", "/input/input.forensicstore", "Plaso/events.plaso"], check=True)
+    store = forensicstore.open(STORE_PATH)
+    try:
+        write_ledger(store, timelined)
+        for log in logs:
+            if os.path.exists(log):
+                store_log(store, log)
+        store.insert(report)
+    finally:
+        store.close()
 
 
 if __name__ == '__main__':
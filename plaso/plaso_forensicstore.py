@@ -18,11 +18,42 @@
 
 from __future__ import unicode_literals
 
+import collections
+import datetime
+import json
+import time
+import uuid
+
 import forensicstore
+from plaso.formatters import manager as formatters_manager
+from plaso.lib import errors
 from plaso.output import interface
 from plaso.output import manager
 from plaso.serializer import json_serializer
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _EncodeJSON(json_dict):
+    """Encodes a dict as JSON, with orjson if it is installed.
+
+    Args:
+      json_dict (dict[str, object]): dict to encode.
+
+    Returns:
+      str: JSON string.
+    """
+    if orjson:
+        try:
+            return orjson.dumps(json_dict).decode('utf-8')
+        except TypeError:
+            # For example integers that do not fit in 64-bit.
+            pass
+    return json.dumps(json_dict)
+
 
 class ForensicstoreOutputModule(interface.OutputModule):
     """Output module for the forensicstore format."""
@@ -32,6 +63,33 @@ class ForensicstoreOutputModule(interface.OutputModule):
 
     _JSON_SERIALIZER = json_serializer.JSONAttributeContainerSerializer
 
+    # Attribute values that need no conversion before JSON encoding.
+    _PLAIN_TYPES = (str, int, float, bool)
+
+    # Number of events inserted per transaction.
+    DEFAULT_BATCH_SIZE = 10000
+
+    _INSERT_QUERY = 'INSERT INTO elements (id, json, insert_time) VALUES (?, ?, ?)'
+
+    # Typed copy of the most queried event attributes, so timelines can be
+    # sorted and filtered without json_extract.
+    _EVENTS_TABLE_QUERY = (
+        'CREATE TABLE IF NOT EXISTS plaso_events ('
+        'id TEXT PRIMARY KEY, timestamp INTEGER, timestamp_desc TEXT, '
+        'data_type TEXT, parser TEXT, filename TEXT, inode INTEGER, '
+        'message TEXT, export_path TEXT)')
+    _EVENTS_INSERT_QUERY = (
+        'INSERT INTO plaso_events (id, timestamp, timestamp_desc, data_type, '
+        'parser, filename, inode, message, export_path) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)')
+    # Index name and columns. Indexes of an earlier run are dropped in Open()
+    # and all indexes are created after the bulk load in Close().
+    _EVENTS_INDEXES = [
+        ('plaso_events_timestamp_index', 'timestamp'),
+        ('plaso_events_data_type_index', 'data_type, timestamp'),
+        ('plaso_events_parser_index', 'parser, timestamp'),
+        ('plaso_events_export_path_index', 'export_path')]
+
     def __init__(self, output_mediator):
         """Initializes the output module object.
 
@@ -44,6 +102,67 @@ class ForensicstoreOutputModule(interface.OutputModule):
         super(ForensicstoreOutputModule, self).__init__(output_mediator)
         self._store = None
         self._filename = None
+        self._batch_size = self.DEFAULT_BATCH_SIZE
+        self._batch = []
+        self._events_batch = []
+        self._events_per_parser = collections.Counter()
+        self._events_filtered = 0
+        self._start_timestamp = None
+        self._end_timestamp = None
+        self._data_types = None
+        self._parsers = None
+        self._source_roots = []
+        self._start_time = None
+        self._formatter_mediator = output_mediator._formatter_mediator  # pylint: disable=protected-access
+
+    def _GetExportPath(self, filename):
+        """Determines the path of a parsed file relative to its source root.
+
+        Args:
+          filename (str): filename of the event data, either below one of the
+              source roots or already relative to the source.
+
+        Returns:
+          str: path without leading and trailing separators or None if the
+              event data has no filename.
+        """
+        if not filename:
+            return None
+        for root in self._source_roots:
+            if filename.startswith(root + '/'):
+                filename = filename[len(root):]
+                break
+        return filename.strip('/')
+
+    def _GetMessage(self, event_data):
+        """Formats the message of event data.
+
+        Args:
+          event_data (EventData): event data.
+
+        Returns:
+          str: message or None if the data type has no matching formatter.
+        """
+        formatter = formatters_manager.FormattersManager.GetFormatterObject(event_data.data_type)
+        if not formatter:
+            return None
+        try:
+            message, _ = formatter.GetMessages(self._formatter_mediator, event_data)
+        except errors.WrongFormatter:
+            return None
+        return message
+
+    def _CopyAttributes(self, json_dict, attribute_container):
+        """Copies the attributes of a container into a flat dict.
+
+        Args:
+          json_dict (dict[str, object]): dict to copy the attributes into.
+          attribute_container (AttributeContainer): attribute container.
+        """
+        for name, value in attribute_container.GetAttributes():
+            if value is not None and not isinstance(value, self._PLAIN_TYPES):
+                value = self._JSON_SERIALIZER._ConvertAttributeValueToDict(value)  # pylint: disable=protected-access
+            json_dict[name] = value
 
     def _WriteSerializedDict(self, event, event_data, event_tag):
         """Writes an event, event data and event tag to serialized form.
@@ -54,29 +173,20 @@ class ForensicstoreOutputModule(interface.OutputModule):
         Returns:
           dict[str, object]: JSON serialized objects.
         """
-        event_data_json_dict = self._JSON_SERIALIZER.WriteSerializedDict(event_data)
-        del event_data_json_dict['__container_type__']
-        del event_data_json_dict['__type__']
-
-        inode = event_data_json_dict.get('inode', None)
-        if inode is None:
-            event_data_json_dict['inode'] = 0
-
-        try:
-            message, _ = self._output_mediator.GetFormattedMessages(event_data)
-            event_data_json_dict['message'] = message
-        except errors.WrongFormatter:
-            pass
-
-        event_json_dict = self._JSON_SERIALIZER.WriteSerializedDict(event)
+        event_json_dict = {'__type__': 'AttributeContainer'}
+        self._CopyAttributes(event_json_dict, event)
+        self._CopyAttributes(event_json_dict, event_data)
         event_json_dict['__container_type__'] = 'plaso'
 
-        event_json_dict.update(event_data_json_dict)
+        if event_json_dict.get('inode', None) is None:
+            event_json_dict['inode'] = 0
 
-        if event_tag:
-            event_tag_json_dict = self._JSON_SERIALIZER.WriteSerializedDict(event_tag)
+        message = self._GetMessage(event_data)
+        if message is not None:
+            event_json_dict['message'] = message
 
-            event_json_dict['tag'] = event_tag_json_dict
+        if event_tag:
+            event_json_dict['tag'] = self._JSON_SERIALIZER.WriteSerializedDict(event_tag)
 
         return event_json_dict
 
@@ -88,13 +198,73 @@ class ForensicstoreOutputModule(interface.OutputModule):
         event_data (EventData): event data.
         event_tag (EventTag): event tag.
         """
+        if not self._MatchesFilters(event, event_data):
+            self._events_filtered += 1
+            return
+
         json_dict = self._WriteSerializedDict(event, event_data, event_tag)
         json_dict["type"] = "event"
-        self._store.insert(json_dict)
+        json_dict["id"] = "event--" + str(uuid.uuid4())
+
+        # Discard empty values like ForensicStore.insert does.
+        element = {
+            key: value for key, value in json_dict.items()
+            if value is not None and not (isinstance(value, list) and not value)}
+        self._store.update_views("event", element)
+
+        self._batch.append((element["id"], _EncodeJSON(element)))
+        self._events_per_parser[element.get("parser", "")] += 1
+        self._events_batch.append((
+            element["id"], element.get("timestamp"), element.get("timestamp_desc"),
+            element.get("data_type"), element.get("parser"), element.get("filename"),
+            element.get("inode"), element.get("message"),
+            self._GetExportPath(element.get("filename"))))
+        if len(self._batch) >= self._batch_size:
+            self._Flush()
+
+    def _MatchesFilters(self, event, event_data):
+        """Checks an event against the time range, data type and parser filters.
+
+        Args:
+          event (EventObject): event.
+          event_data (EventData): event data.
+
+        Returns:
+          bool: True if the event should be written.
+        """
+        if self._start_timestamp is not None and event.timestamp < self._start_timestamp:
+            return False
+        if self._end_timestamp is not None and event.timestamp > self._end_timestamp:
+            return False
+        if self._data_types and event_data.data_type not in self._data_types:
+            return False
+        if self._parsers:
+            # The parser is a chain like winreg/windows_run, any part can match.
+            parser_chain = getattr(event_data, 'parser', None) or ''
+            if not self._parsers.intersection(parser_chain.split('/')):
+                return False
+        return True
+
+    def _Flush(self):
+        """Inserts the buffered events in a single transaction."""
+        if not self._batch:
+            return
+
+        insert_time = datetime.datetime.utcnow().isoformat(timespec='milliseconds') + 'Z'
+        with self._store.connection:
+            self._store.connection.executemany(
+                self._INSERT_QUERY,
+                ((element_id, json_string, insert_time) for element_id, json_string in self._batch))
+            self._store.connection.executemany(self._EVENTS_INSERT_QUERY, self._events_batch)
+        self._batch = []
+        self._events_batch = []
 
     def Open(self):
         """Connects to the database and creates the required tables.
 
+        The indexes of the events table are dropped until Close, so the events
+        of incremental runs are bulk loaded without index updates as well.
+
         Raises:
           IOError: if the specified output file already exists.
           OSError: if the specified output file already exists.
@@ -104,6 +274,11 @@ class ForensicstoreOutputModule(interface.OutputModule):
             raise ValueError('Missing filename.')
 
         self._store = forensicstore.open(self._filename)
+        self._start_time = time.perf_counter()
+        with self._store.connection:
+            self._store.connection.execute(self._EVENTS_TABLE_QUERY)
+            for name, _ in self._EVENTS_INDEXES:
+                self._store.connection.execute('DROP INDEX IF EXISTS {0:s}'.format(name))
 
     def Close(self):
         """Disconnects from the database.
@@ -111,8 +286,59 @@ class ForensicstoreOutputModule(interface.OutputModule):
         This method will create the necessary indices and commit outstanding
         transactions before disconnecting.
         """
+        self._Flush()
+        with self._store.connection:
+            for name, columns in self._EVENTS_INDEXES:
+                self._store.connection.execute(
+                    'CREATE INDEX IF NOT EXISTS {0:s} ON plaso_events({1:s})'.format(name, columns))
+        self._WriteStatistics()
         self._store.close()
 
+    def _WriteStatistics(self):
+        """Adds the number of events per parser and the write rate to the store."""
+        seconds = time.perf_counter() - self._start_time
+        events = sum(self._events_per_parser.values())
+        self._store.insert({
+            'type': 'plaso-statistics',
+            'events': events,
+            'events_per_parser': dict(self._events_per_parser),
+            'events_filtered': self._events_filtered,
+            'seconds': seconds,
+            'events_per_second': events / seconds if seconds else 0})
+
+    def SetBatchSize(self, batch_size):
+        """Sets the number of events inserted per transaction.
+
+        Args:
+          batch_size (int): number of events.
+        """
+        self._batch_size = batch_size
+
+    def SetFilters(self, start_timestamp=None, end_timestamp=None, data_types=None, parsers=None):
+        """Sets the filters events must match to be written.
+
+        Args:
+          start_timestamp (Optional[int]): earliest timestamp in microseconds
+              since January 1, 1970 00:00:00 UTC.
+          end_timestamp (Optional[int]): latest timestamp in microseconds
+              since January 1, 1970 00:00:00 UTC.
+          data_types (Optional[list[str]]): event data types.
+          parsers (Optional[list[str]]): parser names.
+        """
+        self._start_timestamp = start_timestamp
+        self._end_timestamp = end_timestamp
+        self._data_types = frozenset(data_types) if data_types else None
+        self._parsers = frozenset(parsers) if parsers else None
+
+    def SetSourceRoots(self, source_roots):
+        """Sets the directories the parsed files were read from.
+
+        Args:
+          source_roots (list[str]): directories, the path of a file relative
+              to them is written to the export_path column of plaso_events.
+        """
+        self._source_roots = [root.rstrip('/') for root in source_roots or []]
+
     def SetFilename(self, filename):
         """Sets the filename.
 
@@ -18,6 +18,9 @@
 
 from __future__ import unicode_literals
 
+import calendar
+import datetime
+
 from plaso.lib import errors
 from plaso.cli.helpers import interface
 from plaso.cli.helpers import manager
@@ -31,6 +34,107 @@ class ForensicstoreOutputArgumentsHelper(interface.ArgumentsHelper):
     CATEGORY = 'output'
     DESCRIPTION = 'Argument helper for the Forensicstore output module.'
 
+    _DATE_FORMAT = '%Y-%m-%d'
+    _TIME_FORMATS = ['%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', _DATE_FORMAT]
+
+    @classmethod
+    def AddArguments(cls, argument_group):
+        """Adds command line arguments the helper supports to an argument group.
+
+        Args:
+          argument_group (argparse._ArgumentGroup|argparse.ArgumentParser):
+              argparse group.
+        """
+        argument_group.add_argument(
+            '--forensicstore_batch_size', '--forensicstore-batch-size',
+            dest='forensicstore_batch_size', type=int, action='store',
+            default=forensicstore.ForensicstoreOutputModule.DEFAULT_BATCH_SIZE,
+            metavar='SIZE', help=(
+                'Number of events inserted into the forensicstore per '
+                'transaction.'))
+
+        argument_group.add_argument(
+            '--forensicstore_start', '--forensicstore-start',
+            dest='forensicstore_start', type=str, action='store', default=None,
+            metavar='TIME', help=(
+                'Only write events at or after this UTC date and time, '
+                'formatted as YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS.'))
+        argument_group.add_argument(
+            '--forensicstore_end', '--forensicstore-end',
+            dest='forensicstore_end', type=str, action='store', default=None,
+            metavar='TIME', help=(
+                'Only write events at or before this UTC date and time, '
+                'formatted as YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS.'))
+        argument_group.add_argument(
+            '--forensicstore_data_types', '--forensicstore-data-types',
+            dest='forensicstore_data_types', type=str, action='store',
+            default=None, metavar='DATA_TYPES', help=(
+                'Comma separated list of event data types to write, for '
+                'example windows:evtx:record.'))
+        argument_group.add_argument(
+            '--forensicstore_parsers', '--forensicstore-parsers',
+            dest='forensicstore_parsers', type=str, action='store',
+            default=None, metavar='PARSERS', help=(
+                'Comma separated list of parsers whose events are written, '
+                'for example winevtx.'))
+        argument_group.add_argument(
+            '--forensicstore_source_roots', '--forensicstore-source-roots',
+            dest='forensicstore_source_roots', type=str, action='store',
+            default=None, metavar='DIRECTORIES', help=(
+                'Comma separated list of directories the parsed files were '
+                'read from, the paths of the files relative to them are '
+                'stored with their events.'))
+
+    @classmethod
+    def _ParseTimestamp(cls, options, name, end_of_day=False):
+        """Parses a date and time option into a timestamp.
+
+        Args:
+          options (argparse.Namespace): parser options.
+          name (str): name of the option.
+          end_of_day (Optional[bool]): True if a date without time includes
+              the whole day.
+
+        Returns:
+          int: microseconds since January 1, 1970 00:00:00 UTC or None if the
+              option is not set.
+
+        Raises:
+          BadConfigOption: when the option is not a supported date and time.
+        """
+        value = getattr(options, name, None)
+        if not value:
+            return None
+
+        for time_format in cls._TIME_FORMATS:
+            try:
+                date_time = datetime.datetime.strptime(value, time_format)
+            except ValueError:
+                continue
+            timestamp = calendar.timegm(date_time.timetuple()) * 1000000
+            if end_of_day and time_format == cls._DATE_FORMAT:
+                timestamp += 86400 * 1000000 - 1
+            return timestamp
+
+        raise errors.BadConfigOption(
+            'Unsupported date and time: {0:s}.'.format(value))
+
+    @classmethod
+    def _ParseList(cls, options, name):
+        """Parses a comma separated list option.
+
+        Args:
+          options (argparse.Namespace): parser options.
+          name (str): name of the option.
+
+        Returns:
+          list[str]: values or None if the option is not set.
+        """
+        value = getattr(options, name, None)
+        if not value:
+            return None
+        return [item.strip() for item in value.split(',') if item.strip()]
+
     # pylint: disable=arguments-differ
     @classmethod
     def ParseOptions(cls, options, output_module):
@@ -55,5 +159,22 @@ class ForensicstoreOutputArgumentsHelper(interface.ArgumentsHelper):
 
         output_module.SetFilename(filename)
 
+        batch_size = cls._ParseNumericOption(
+            options, 'forensicstore_batch_size',
+            default_value=forensicstore.ForensicstoreOutputModule.DEFAULT_BATCH_SIZE)
+        if batch_size < 1:
+            raise errors.BadConfigOption(
+                'Invalid forensicstore batch size: {0:d}.'.format(batch_size))
+        output_module.SetBatchSize(batch_size)
+
+        output_module.SetFilters(
+            start_timestamp=cls._ParseTimestamp(options, 'forensicstore_start'),
+            end_timestamp=cls._ParseTimestamp(
+                options, 'forensicstore_end', end_of_day=True),
+            data_types=cls._ParseList(options, 'forensicstore_data_types'),
+            parsers=cls._ParseList(options, 'forensicstore_parsers'))
+        output_module.SetSourceRoots(
+            cls._ParseList(options, 'forensicstore_source_roots'))
+
 
 manager.ArgumentHelperManager.RegisterHelper(ForensicstoreOutputArgumentsHelper)
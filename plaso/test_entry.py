@@ -0,0 +1,86 @@
+# Copyright (c) 2020 Siemens AG
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+
+import entry
+import forensicstore
+import pytest
+
+
+@pytest.fixture
+def store():
+    tmpdir = tempfile.mkdtemp()
+    store = forensicstore.new(os.path.join(tmpdir, "input.forensicstore"))
+    yield store
+    store.close()
+    shutil.rmtree(tmpdir)
+
+
+def add_events(store, export_paths):
+    """ add an event per export path as psort would, with its plaso_events row """
+    store.connection.execute("CREATE TABLE plaso_events (id TEXT NOT NULL, export_path TEXT)")
+    for export_path in export_paths:
+        element_id = store.insert({"type": "event", "filename": "/" + export_path})
+        store.connection.execute("INSERT INTO plaso_events (id, export_path) VALUES (?, ?)", (element_id, export_path))
+    store.connection.commit()
+
+
+def test_file_hash():
+    assert entry.file_hash({"export_path": "/a", "hashes": {"MD5": "m", "SHA-1": "s1"}}) == "s1"
+    assert entry.file_hash({"export_path": "/a", "hashes": {"SHA-256": "s256", "MD5": "m"}}) == "s256"
+    assert entry.file_hash({"export_path": "/a", "size": 12}) == "/a:12"
+    assert entry.file_hash({"export_path": "/a"}) == "/a:"
+
+
+def test_stage_file(store):
+    element_id = store.add_file_element("WindowsEventLogs", "System.evtx", None, None, None, origin={}, errors=None)
+    with store.add_file_element_export(element_id) as dest:
+        dest.write(b"ElfFile")
+    item, = store.select([{"type": "file"}])
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dst_path = os.path.join(tmpdir, "System.evtx")
+        entry.stage_file(store, item["export_path"], dst_path)
+        with open(dst_path, "rb") as staged:
+            assert staged.read() == b"ElfFile"
+
+
+def test_ledger(store):
+    assert entry.read_ledger(store) == {}
+
+    entry.write_ledger(store, [("file--1", "h1"), ("file--2", "h2")])
+    entry.write_ledger(store, [("file--1", "h3")])
+
+    assert entry.read_ledger(store) == {"file--1": "h3", "file--2": "h2"}
+
+
+def test_remove_events(store):
+    entry.remove_events(store, "/WindowsEventLogs/System.evtx")  # no plaso_events table yet
+
+    add_events(store, [
+        "WindowsEventLogs/System.evtx",
+        "WindowsEventLogs/System.evtx",
+        "WindowsEventLogs/OldSystem.evtx",
+        "WindowsEventLogs/System.evtx.bak",
+    ])
+
+    entry.remove_events(store, "/WindowsEventLogs/System.evtx")
+
+    remaining = sorted(event["filename"] for event in store.select([{"type": "event"}]))
+    assert remaining == ["/WindowsEventLogs/OldSystem.evtx", "/WindowsEventLogs/System.evtx.bak"]
+    rows = store.connection.execute("SELECT export_path FROM plaso_events ORDER BY export_path").fetchall()
+    assert ["/" + row[0] for row in rows] == remaining
@@ -0,0 +1,159 @@
+# Copyright (c) 2020 Siemens AG
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# The output module and its arguments helper are installed into plaso by the
+# Dockerfile, run these tests inside the plaso image.
+# pylint: disable=protected-access
+
+import argparse
+import calendar
+import datetime
+import os
+import shutil
+import tempfile
+from types import SimpleNamespace
+
+import forensicstore
+import pytest
+
+plaso_output = pytest.importorskip("plaso.output.forensicstore")
+plaso_output_helper = pytest.importorskip("plaso.cli.helpers.forensicstore_output")
+from plaso.containers import events  # noqa: E402 pylint: disable=wrong-import-position
+from plaso.lib import errors  # noqa: E402 pylint: disable=wrong-import-position
+
+Helper = plaso_output_helper.ForensicstoreOutputArgumentsHelper
+
+
+@pytest.fixture
+def module():
+    return plaso_output.ForensicstoreOutputModule(SimpleNamespace(_formatter_mediator=None))
+
+
+@pytest.fixture
+def store_path():
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, "input.forensicstore")
+    forensicstore.new(path).close()
+    yield path
+    shutil.rmtree(tmpdir)
+
+
+def new_event(timestamp=0, data_type="test:event", parser="winreg/windows_run"):
+    event = events.EventObject()
+    event.timestamp = timestamp
+    event.timestamp_desc = "Creation Time"
+    event_data = events.EventData(data_type=data_type)
+    event_data.parser = parser
+    return event, event_data
+
+
+def events_indexes(path):
+    store = forensicstore.open(path)
+    rows = store.connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'plaso_events'").fetchall()
+    store.close()
+    return sorted(row[0] for row in rows if not row[0].startswith("sqlite_autoindex"))
+
+
+def test_matches_filters(module):
+    module.SetFilters(start_timestamp=10, end_timestamp=20, data_types=["test:event"], parsers=["windows_run"])
+
+    assert module._MatchesFilters(*new_event(10))
+    assert module._MatchesFilters(*new_event(20, parser="windows_run"))
+    assert not module._MatchesFilters(*new_event(9))
+    assert not module._MatchesFilters(*new_event(21))
+    assert not module._MatchesFilters(*new_event(15, data_type="other:event"))
+    assert not module._MatchesFilters(*new_event(15, parser="winreg/windows_services"))
+    assert not module._MatchesFilters(*new_event(15, parser=None))
+
+    module.SetFilters()
+    assert module._MatchesFilters(*new_event(-1, data_type="other:event", parser=None))
+
+
+def test_copy_attributes(module):
+    _, event_data = new_event()
+    event_data.strings = ["a", "b"]
+    event_data.offset = None
+
+    json_dict = {}
+    module._CopyAttributes(json_dict, event_data)
+
+    assert json_dict["data_type"] == "test:event"
+    assert json_dict["parser"] == "winreg/windows_run"
+    assert json_dict["strings"] == ["a", "b"]
+    assert json_dict["offset"] is None
+
+
+def test_write_serialized_dict(module):
+    event, event_data = new_event(1234)
+    event_tag = events.EventTag()
+    event_tag.AddLabel("malware")
+
+    json_dict = module._WriteSerializedDict(event, event_data, event_tag)
+
+    assert json_dict["__type__"] == "AttributeContainer"
+    assert json_dict["__container_type__"] == "plaso"
+    assert json_dict["timestamp"] == 1234
+    assert json_dict["timestamp_desc"] == "Creation Time"
+    assert json_dict["data_type"] == "test:event"
+    assert json_dict["inode"] == 0
+    assert "message" not in json_dict
+    assert json_dict["tag"]["labels"] == ["malware"]
+    assert "tag" not in module._WriteSerializedDict(event, event_data, None)
+
+
+def test_events_indexes(module, store_path):
+    module.SetFilename(store_path)
+    module.Open()
+    module.Close()
+    assert events_indexes(store_path) == sorted(name for name, _ in module._EVENTS_INDEXES)
+
+    # an incremental run loads its events without the indexes
+    module.Open()
+    assert events_indexes(store_path) == []
+    module.Close()
+    assert events_indexes(store_path) == sorted(name for name, _ in module._EVENTS_INDEXES)
+
+
+def test_parse_timestamp():
+    day = calendar.timegm(datetime.datetime(2020, 1, 2).timetuple()) * 1000000
+    options = argparse.Namespace(start="2020-01-02", end="2020-01-02T10:00:00", empty="", invalid="01/02/2020")
+
+    assert Helper._ParseTimestamp(options, "start") == day
+    assert Helper._ParseTimestamp(options, "start", end_of_day=True) == day + 86400 * 1000000 - 1
+    assert Helper._ParseTimestamp(options, "end", end_of_day=True) == day + 10 * 3600 * 1000000
+    assert Helper._ParseTimestamp(options, "empty") is None
+    assert Helper._ParseTimestamp(options, "missing") is None
+    with pytest.raises(errors.BadConfigOption):
+        Helper._ParseTimestamp(options, "invalid")
+
+
+def test_parse_list():
+    options = argparse.Namespace(parsers=" winevtx, winreg,,", empty="")
+
+    assert Helper._ParseList(options, "parsers") == ["winevtx", "winreg"]
+    assert Helper._ParseList(options, "empty") is None
+    assert Helper._ParseList(options, "missing") is None
+
+
+def test_get_export_path(module):
+    module.SetSourceRoots(["/tmp/staging/winevt_winevtx/", "/tmp/staging/winreg"])
+
+    assert module._GetExportPath("/tmp/staging/winevt_winevtx/WindowsEventLogs/System.evtx") == \
+        "WindowsEventLogs/System.evtx"
+    assert module._GetExportPath("/tmp/staging/winreg/Registry/SYSTEM") == "Registry/SYSTEM"
+    # plaso already strips the source directory of some paths
+    assert module._GetExportPath("/WindowsEventLogs/System.evtx") == "WindowsEventLogs/System.evtx"
+    assert module._GetExportPath("/tmp/staging/winregistry/SYSTEM") == "tmp/staging/winregistry/SYSTEM"
+    assert module._GetExportPath(None) is None
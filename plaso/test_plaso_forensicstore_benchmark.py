@@ -0,0 +1,145 @@
+# Copyright (c) 2020 Siemens AG
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Throughput of the forensicstore output module, compared to the serialization
+through JSONAttributeContainerSerializer it replaced. Run it inside the plaso
+image. The events are read from the plaso storage file in
+PLASO_BENCHMARK_STORAGE if it is set and generated otherwise, their number
+can be set with PLASO_BENCHMARK_EVENTS.
+"""
+
+# pylint: disable=protected-access
+
+import json
+import os
+import shutil
+import tempfile
+
+import forensicstore
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+plaso_output = pytest.importorskip("plaso.output.forensicstore")
+from plaso.containers import events as plaso_events  # noqa: E402 pylint: disable=wrong-import-position
+from plaso.engine import knowledge_base  # noqa: E402 pylint: disable=wrong-import-position
+from plaso.formatters import mediator as formatters_mediator  # noqa: E402 pylint: disable=wrong-import-position
+from plaso.lib import errors  # noqa: E402 pylint: disable=wrong-import-position
+from plaso.output import mediator as output_mediator  # noqa: E402 pylint: disable=wrong-import-position
+from plaso.serializer import json_serializer  # noqa: E402 pylint: disable=wrong-import-position
+from plaso.storage import factory as storage_factory  # noqa: E402 pylint: disable=wrong-import-position
+
+SERIALIZER = json_serializer.JSONAttributeContainerSerializer
+
+STORAGE = os.environ.get("PLASO_BENCHMARK_STORAGE")
+EVENTS = int(os.environ.get("PLASO_BENCHMARK_EVENTS", "10000"))
+
+
+def read_events(path, limit):
+    """ Load events and their event data from a plaso storage file into memory """
+    storage_reader = storage_factory.StorageFactory.CreateStorageReaderForFile(path)
+    events = []
+    for event in storage_reader.GetSortedEvents():
+        event_data = storage_reader.GetEventDataByIdentifier(event.GetEventDataIdentifier())
+        events.append((event, event_data))
+        if len(events) >= limit:
+            break
+    storage_reader.Close()
+    return events
+
+
+def generate_events(count):
+    """ Windows event log records with the attributes plaso's winevtx parser sets """
+    events = []
+    for i in range(count):
+        event = plaso_events.EventObject()
+        event.timestamp = 1577836800000000 + i * 1000000
+        event.timestamp_desc = "Creation Time"
+        event_data = plaso_events.EventData(data_type="windows:evtx:record")
+        event_data.parser = "winevtx"
+        event_data.event_identifier = 4624
+        event_data.record_number = i
+        event_data.source_name = "Microsoft-Windows-Security-Auditing"
+        event_data.computer_name = "host%d" % (i % 8)
+        event_data.strings = ["S-1-5-18", "user%d" % (i % 100), "DOMAIN", "0x3e7"]
+        event_data.filename = "/tmp/plaso/winevtx/WindowsEventLogs/Security.evtx"
+        events.append((event, event_data))
+    return events
+
+
+def legacy_serialize(mediator, event, event_data):
+    """ Serialization of the output module before the direct attribute extraction """
+    event_data_json_dict = SERIALIZER.WriteSerializedDict(event_data)
+    del event_data_json_dict['__container_type__']
+    del event_data_json_dict['__type__']
+    if event_data_json_dict.get('inode', None) is None:
+        event_data_json_dict['inode'] = 0
+    try:
+        message, _ = mediator.GetFormattedMessages(event_data)
+        event_data_json_dict['message'] = message
+    except errors.WrongFormatter:
+        pass
+    event_json_dict = SERIALIZER.WriteSerializedDict(event)
+    event_json_dict['__container_type__'] = 'plaso'
+    event_json_dict.update(event_data_json_dict)
+    return json.dumps(event_json_dict)
+
+
+@pytest.fixture(scope="module")
+def events():
+    return read_events(STORAGE, EVENTS) if STORAGE else generate_events(EVENTS)
+
+
+@pytest.fixture(scope="module")
+def mediator():
+    return output_mediator.OutputMediator(knowledge_base.KnowledgeBase(), formatters_mediator.FormatterMediator())
+
+
+@pytest.fixture
+def module(mediator):
+    tmpdir = tempfile.mkdtemp()
+    store_path = os.path.join(tmpdir, "benchmark.forensicstore")
+    forensicstore.new(store_path).close()
+    module = plaso_output.ForensicstoreOutputModule(mediator)
+    module.SetFilename(store_path)
+    module.Open()
+    yield module
+    module.Close()
+    shutil.rmtree(tmpdir)
+
+
+def events_per_second(benchmark, events):
+    if benchmark.stats:  # not set with --benchmark-disable
+        benchmark.extra_info["events_per_second"] = len(events) / benchmark.stats.stats.mean
+
+
+def test_legacy_serialize(benchmark, events, mediator):
+    benchmark(lambda: [legacy_serialize(mediator, event, event_data) for event, event_data in events])
+    events_per_second(benchmark, events)
+
+
+def test_serialize(benchmark, events, module):
+    benchmark(lambda: [plaso_output._EncodeJSON(module._WriteSerializedDict(event, event_data, None))
+                       for event, event_data in events])
+    events_per_second(benchmark, events)
+
+
+def test_write(benchmark, events, module):
+    def write():
+        for event, event_data in events:
+            module.WriteEventBody(event, event_data, None)
+        module._Flush()
+
+    benchmark(write)
+    events_per_second(benchmark, events)
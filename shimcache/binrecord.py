@@ -0,0 +1,72 @@
+# Copyright (c) 2020 Siemens AG
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Declarative fixed layout records for binary artifact parsers. A layout is a
+list of (name, struct format) fields, padding fields are named None. Records
+are read from memoryviews without copying the underlying data.
+"""
+
+import logging
+import struct
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Record:
+    """ A fixed layout little endian record """
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.struct = struct.Struct('<' + ''.join(fmt for _, fmt in fields))
+        self.size = self.struct.size
+        self.fields = [field for field, _ in fields if field is not None]
+
+    def unpack_from(self, data, offset=0):
+        """ Unpack the record at offset as a plain tuple of its named fields """
+        return self.struct.unpack_from(data, offset)
+
+    def iter_unpack(self, data, offset, count):
+        """
+        Unpack count consecutive records starting at offset as plain tuples.
+        Records cut off by the end of data are skipped.
+        """
+        view = memoryview(data)[offset:offset + count * self.size]
+        complete = len(view) // self.size
+        if complete < count:
+            LOGGER.debug("[-] Skipping %d truncated %s records..." % (count - complete, self.name))
+        return self.struct.iter_unpack(view[:complete * self.size])
+
+
+def iter_tagged(data, offset, header, magic):
+    """
+    Walk variable sized records that each start with a header of magic, a
+    checksum and the payload length. Yield the offset of every payload and
+    its length, a wrong magic raises a ValueError.
+    """
+    data = memoryview(data)
+    data_len = len(data)
+    while offset < data_len:
+        tag, _, length = header.unpack_from(data, offset)
+        offset += header.size
+        if tag != magic:
+            raise ValueError("Invalid version magic tag found: 0x%x" % struct.unpack("<L", tag)[0])
+        yield offset, length
+        offset += length
+
+
+def utf16(data, offset, length):
+    """ Decode length bytes of UTF-16LE at offset """
+    return str(memoryview(data)[offset:offset + length], 'utf-16le', 'replace')
+
@@ -0,0 +1,137 @@
+# Copyright (c) 2020 Siemens AG
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Generator for synthetic AppCompatCache values in all formats read by the shimcache plugin """
+
+import struct
+
+import shimcache
+
+# 2019-04-17 18:40:00, entries are one hour and one tick apart
+BASE_FILETIME = 132000000000000000
+FILETIME_STEP = 3600 * shimcache.FILETIME_TICKS + 1
+
+
+def entry_path(index):
+    """ Path of the index-th generated entry """
+    return "C:\\Windows\\System32\\prog%05d.exe" % index
+
+
+def entry_filetime(index):
+    """ Last modified FILETIME of the index-th generated entry """
+    return BASE_FILETIME + index * FILETIME_STEP
+
+
+def entry_executed(index):
+    """ Executed flag of the index-th generated entry, for formats that have one """
+    return index % 2 == 1
+
+
+def _flags(index):
+    return shimcache.CSRSS_FLAG if entry_executed(index) else 0
+
+
+def _split(filetime):
+    return filetime & 0xffffffff, filetime >> 32
+
+
+def xp_cache(count):
+    """ Windows XP 32-bit cache """
+    data = bytearray(struct.pack("<LLL", shimcache.WINXP_MAGIC32, 0, count))
+    data += bytes(shimcache.WINXP_HEADER_SIZE32 - len(data))
+    for i in range(count):
+        path = entry_path(i).encode("utf-16le")
+        data += path + bytes(shimcache.MAX_PATH + 8 - len(path))
+        data += struct.pack("<QQQ", entry_filetime(i), 1000 + i, entry_filetime(i) + 1)
+    return bytes(data)
+
+
+def nt5_cache(count, is32bit, file_sizes=True):
+    """ Windows Server 2003, Vista and Server 2008 cache, with file sizes or with exec flags """
+    entry_size = shimcache.NT5_2_ENTRY_SIZE32 if is32bit else shimcache.NT5_2_ENTRY_SIZE64
+    entries = bytearray()
+    strings = bytearray()
+    strings_offset = shimcache.CACHE_HEADER_SIZE_NT5_2 + count * entry_size
+    for i in range(count):
+        path = ("\\??\\" + entry_path(i)).encode("utf-16le")
+        offset = strings_offset + len(strings)
+        strings += path + b"\x00\x00"
+        low, high = _split(entry_filetime(i))
+        size = 1000 + i if file_sizes else _flags(i)
+        if is32bit:
+            entries += struct.pack("<2H 3L 2L", len(path), len(path) + 2, offset, low, high, size, 0)
+        else:
+            entries += struct.pack("<2H 4x Q 2L 2L", len(path), len(path) + 2, offset, low, high, size, 0)
+    return struct.pack("<LL", shimcache.CACHE_MAGIC_NT5_2, count) + bytes(entries) + bytes(strings)
+
+
+def nt6_cache(count, is32bit):
+    """ Windows 7 and Server 2008 R2 cache """
+    entry_size = shimcache.NT6_1_ENTRY_SIZE32 if is32bit else shimcache.NT6_1_ENTRY_SIZE64
+    entries = bytearray()
+    strings = bytearray()
+    strings_offset = shimcache.CACHE_HEADER_SIZE_NT6_1 + count * entry_size
+    for i in range(count):
+        path = ("\\??\\" + entry_path(i)).encode("utf-16le")
+        offset = strings_offset + len(strings)
+        strings += path + b"\x00\x00"
+        low, high = _split(entry_filetime(i))
+        if is32bit:
+            entries += struct.pack("<2H 7L", len(path), len(path) + 2, offset, low, high, _flags(i), 0, 0, 0)
+        else:
+            entries += struct.pack("<2H 4x Q 4L 2Q", len(path), len(path) + 2, offset, low, high, _flags(i), 0, 0, 0)
+    header = struct.pack("<LL", shimcache.CACHE_MAGIC_NT6_1, count)
+    header += bytes(shimcache.CACHE_HEADER_SIZE_NT6_1 - len(header))
+    return header + bytes(entries) + bytes(strings)
+
+
+def win8_cache(count, magic=shimcache.WIN8_MAGIC):
+    """ Windows 8 and Server 2012 cache, pass WIN81_MAGIC for Windows 8.1 """
+    data = bytearray(shimcache.WIN8_STATS_SIZE)
+    for i in range(count):
+        path = entry_path(i).encode("utf-16le")
+        package = "Microsoft.Package".encode("utf-16le") if i % 4 == 0 else b""
+        entry = struct.pack("<H", len(path)) + path + struct.pack("<H", len(package)) + package
+        entry += struct.pack("<LLQL", _flags(i), 0, entry_filetime(i), 0)
+        data += magic + struct.pack("<LL", 0, len(entry)) + entry
+    return bytes(data)
+
+
+def win10_cache(count, creators_update=False):
+    """ Windows 10 cache, before or since the Creators Update """
+    stats_size = shimcache.WIN10_CREATORS_STATS_SIZE if creators_update else shimcache.WIN10_STATS_SIZE
+    data = bytearray(struct.pack("<L", stats_size))
+    data += bytes(stats_size - len(data))
+    for i in range(count):
+        path = entry_path(i).encode("utf-16le")
+        # the generated entries never start at WIN8_STATS_SIZE, where the
+        # Windows 8 magic would be detected
+        entry = struct.pack("<H", len(path)) + path + struct.pack("<QL", entry_filetime(i), 4) + bytes(4)
+        data += shimcache.WIN10_MAGIC + struct.pack("<LL", 0, len(entry)) + entry
+    return bytes(data)
+
+
+# Generators for all supported formats, called with the number of entries
+FORMATS = {
+    "xp": xp_cache,
+    "nt5_32": lambda count: nt5_cache(count, True),
+    "nt5_64": lambda count: nt5_cache(count, False),
+    "nt5_32_flags": lambda count: nt5_cache(count, True, file_sizes=False),
+    "nt6_32": lambda count: nt6_cache(count, True),
+    "nt6_64": lambda count: nt6_cache(count, False),
+    "win8": win8_cache,
+    "win81": lambda count: win8_cache(count, shimcache.WIN81_MAGIC),
+    "win10": win10_cache,
+    "win10_creators": lambda count: win10_cache(count, creators_update=True),
+}
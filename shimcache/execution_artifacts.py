@@ -0,0 +1,183 @@
+# Copyright (c) 2020 Siemens AG
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Registry backed execution artifacts: the shimcache, BAM/DAM and UserAssist.
+All of them are read in a single pass over the registry key elements of a
+store.
+"""
+
+import codecs
+import json
+import logging
+
+import binrecord
+import forensicstore
+import shimcache
+
+LOGGER = logging.getLogger(__name__)
+
+# BAM and DAM values start with the FILETIME of the last execution
+BAM_ENTRY = binrecord.Record('BamEntry', [('LastExecution', 'Q')])
+
+# UserAssist values since Windows 7 and on Windows XP
+USERASSIST_ENTRY = binrecord.Record('UserAssistEntry', [
+    ('Session', 'L'), ('RunCount', 'L'), ('FocusCount', 'L'), ('FocusTime', 'L'),
+    (None, '44x'), ('LastExecution', 'Q'), (None, '4x')])
+USERASSIST_ENTRY_XP = binrecord.Record('UserAssistEntryXP', [
+    ('Session', 'L'), ('RunCount', 'L'), ('LastExecution', 'Q')])
+# Windows XP starts counting runs at 5
+USERASSIST_XP_RUN_COUNT_BASE = 5
+# Session bookkeeping values, not entries
+USERASSIST_SESSION_PREFIX = 'UEME_CTL'
+
+
+def parse_shimcache(key, values, time_format=shimcache.TIME_FORMAT_ISO):
+    """ Parse the AppCompatCache value of a Session Manager key """
+    for value in values:
+        if value.get('name', '').lower() == 'appcompatcache' and value.get('data'):
+            yield from shimcache.parse_appcompatcache(key, value['data'], time_format)
+
+
+def parse_bam(key, values, time_format=shimcache.TIME_FORMAT_ISO):
+    """ Parse the per user key of the Background or Desktop Activity Moderator """
+    parts = key.split('\\')
+    service = next((part.lower() for part in parts if part.lower() in ('bam', 'dam')), 'bam')
+    for value in values:
+        # Version and SequenceNumber are stored as REG_DWORD
+        if value.get('data_type') != 'REG_BINARY' or not value.get('data'):
+            continue
+        data = shimcache.decode_value_data(value['data'])
+        if data is None or len(data) < BAM_ENTRY.size:
+            continue
+        last_execution, = BAM_ENTRY.unpack_from(data)
+        yield {
+            'type': service,
+            'Last Execution': shimcache.format_filetime(last_execution, time_format),
+            'Path': value.get('name', ''),
+            'SID': parts[-1],
+            'Source Key': parts[2],
+        }
+
+
+def parse_userassist(key, values, time_format=shimcache.TIME_FORMAT_ISO):
+    """ Parse the Count key of a UserAssist GUID, value names are ROT13 encoded """
+    parts = key.split('\\')
+    user = parts[1] if parts[0].upper() == 'HKEY_USERS' else ''
+    for value in values:
+        name = codecs.decode(value.get('name', ''), 'rot_13')
+        if name.startswith(USERASSIST_SESSION_PREFIX) or not value.get('data'):
+            continue
+        data = shimcache.decode_value_data(value['data'])
+        if data is None:
+            continue
+
+        if len(data) >= USERASSIST_ENTRY.size:
+            _, run_count, focus_count, focus_time, last_execution = USERASSIST_ENTRY.unpack_from(data)
+        elif len(data) >= USERASSIST_ENTRY_XP.size:
+            _, run_count, last_execution = USERASSIST_ENTRY_XP.unpack_from(data)
+            run_count = max(run_count - USERASSIST_XP_RUN_COUNT_BASE, 0)
+            focus_count, focus_time = 'N/A', 'N/A'
+        else:
+            continue
+
+        yield {
+            'type': 'userassist',
+            'Last Execution': shimcache.format_filetime(last_execution, time_format),
+            'Path': name,
+            'Run Count': run_count,
+            'Focus Count': focus_count,
+            'Focus Time': focus_time,
+            'GUID': parts[-2],
+            'User': user,
+        }
+
+
+# Registry keys as matched with LIKE and the parser of their values
+PARSERS = [
+    (shimcache.APPCOMPAT_KEY_PATTERN, parse_shimcache),
+    ("HKEY_LOCAL_MACHINE\\System\\%ControlSet%\\Services\\bam\\%UserSettings\\%", parse_bam),
+    ("HKEY_LOCAL_MACHINE\\System\\%ControlSet%\\Services\\dam\\%UserSettings\\%", parse_bam),
+    ("%\\Software\\Microsoft\\Windows\\CurrentVersion\\Explorer\\UserAssist\\%\\Count", parse_userassist),
+]
+
+# Key prefixes covering every PARSERS pattern, the keys are looked up in
+# these ranges of the registry key index before the patterns are matched
+KEY_PREFIXES = [
+    shimcache.APPCOMPAT_KEY_PREFIX,
+    "HKEY_USERS\\",
+    "HKEY_CURRENT_USER\\",
+]
+
+# The unary plus keeps SQLite from picking the type index over the key range
+KEY_RANGE_QUERY = "SELECT id, json_extract(json, '$.key') AS key, " \
+                  "json_extract(json, '$.values') AS key_values " \
+                  "FROM elements " \
+                  "WHERE json_extract(json, '$.key') >= ? COLLATE NOCASE " \
+                  "AND json_extract(json, '$.key') < ? COLLATE NOCASE " \
+                  "AND +json_extract(json, '$.type') = 'windows-registry-key'"
+
+# Select every registry key any parser is interested in together with the
+# index of that parser, so the elements are only read once
+REGISTRY_QUERY = "SELECT id, key, key_values, parser FROM (" \
+                 "SELECT id, key, key_values, " \
+                 "CASE " + " ".join("WHEN key LIKE ? THEN %d" % i for i in range(len(PARSERS))) + " END AS parser " \
+                 "FROM (" + " UNION ALL ".join([KEY_RANGE_QUERY] * len(KEY_PREFIXES)) + ")" \
+                 ") WHERE parser IS NOT NULL"
+
+
+def registry_query_parameters():
+    """ Parameters of REGISTRY_QUERY: the parser patterns, then the bounds of each key prefix """
+    parameters = [pattern for pattern, _ in PARSERS]
+    for prefix in KEY_PREFIXES:
+        parameters.extend(shimcache.key_prefix_range(prefix))
+    return parameters
+
+
+def select_registry(store):
+    """ Yield element id, key, values and parser of every registry key with execution artifacts """
+    cur = store.connection.cursor()
+    shimcache.create_key_index(cur)
+    try:
+        cur.execute(REGISTRY_QUERY, registry_query_parameters())
+        for key_id, key, values, parser in cur:
+            yield key_id, key, json.loads(values) if values else [], PARSERS[parser][1]
+    finally:
+        cur.close()
+
+
+def store_results(store, time_format=shimcache.TIME_FORMAT_ISO):
+    """ Yield the parsed rows of all execution artifacts in the store """
+    for _, key, values, parser in select_registry(store):
+        yield from parser(key, values, time_format)
+
+
+def write_results(store, time_format=shimcache.TIME_FORMAT_ISO):
+    """ Write the parsed rows back into the store, linked to their registry key element """
+    # the keys are fetched first, the store must not change while they are read
+    for key_id, key, values, parser in list(select_registry(store)):
+        results = list(parser(key, values, time_format))
+        for result in results:
+            result['registry_key_ref'] = key_id
+        shimcache.insert_results(store, results)
+
+
+def main(url, time_format=shimcache.TIME_FORMAT_ISO, write=False):
+    store = forensicstore.open(url)
+    if write:
+        write_results(store, time_format)
+    else:
+        for result in store_results(store, time_format):
+            print(json.dumps(result))
+    store.close()
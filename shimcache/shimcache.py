@@ -28,22 +28,84 @@
 """ Shimcache analyser module based on Mandiant's open source shimcache parser """
 # pylint: skip-file
 
+import argparse
+import collections
 import datetime
-import io as sio
+import functools
 import json
 import logging
 import os
+import sqlite3
 import struct
+import sys
+import uuid
 from base64 import b64decode
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
+import binrecord
 import forensicstore
 
 LOGGER = logging.getLogger(__name__)
 
+# Output formats for timestamps: formatted with g_timeformat, the raw 64-bit
+# FILETIME or seconds since the Unix epoch
+TIME_FORMAT_ISO = 'iso'
+TIME_FORMAT_RAW = 'raw'
+TIME_FORMAT_EPOCH = 'epoch'
+TIME_FORMATS = [TIME_FORMAT_ISO, TIME_FORMAT_RAW, TIME_FORMAT_EPOCH]
+
+
+# Registry keys holding the cache, as matched with LIKE. The fixed prefix is
+# used to narrow the search down with an index range first.
+APPCOMPAT_KEY_PREFIX = "HKEY_LOCAL_MACHINE\\System\\"
+APPCOMPAT_KEY_PATTERN = APPCOMPAT_KEY_PREFIX + "%ControlSet%\\Control\\Session Manager\\AppCompat%"
+
+# Case insensitive index on the registry key path, created on first use
+KEY_INDEX_QUERY = "CREATE INDEX IF NOT EXISTS key_nocase_index " \
+                  "ON elements(json_extract(json, '$.key') COLLATE NOCASE)"
+
+# Fetch only the AppCompatCache value data of the matching keys
+APPCOMPAT_QUERY = "SELECT elements.id, json_extract(elements.json, '$.key'), " \
+                  "json_extract(value.value, '$.data') " \
+                  "FROM elements, json_each(elements.json, '$.values') AS value " \
+                  "WHERE json_extract(elements.json, '$.key') >= ? COLLATE NOCASE " \
+                  "AND json_extract(elements.json, '$.key') < ? COLLATE NOCASE " \
+                  "AND json_extract(elements.json, '$.key') LIKE ? " \
+                  "AND lower(json_extract(value.value, '$.name')) = 'appcompatcache'"
+
+INSERT_QUERY = "INSERT INTO elements (id, json, insert_time) VALUES (?, ?, ?)"
+
+
+def key_prefix_range(prefix):
+    """
+    Bounds of the registry keys starting with prefix, keys sharing the prefix
+    sort between the prefix and the prefix with the trailing backslash
+    replaced by the next character
+    """
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def create_key_index(cur):
+    """ Create the case insensitive registry key index if it is missing """
+    try:
+        cur.execute(KEY_INDEX_QUERY)
+    except sqlite3.OperationalError as err:
+        LOGGER.warning("Could not create registry key index: %s", err)
 
-def transform(obj):
-    entries = []
 
+def select_appcompatcache(store):
+    """ Yield element id, key and hex data of every AppCompatCache value in the store """
+    cur = store.connection.cursor()
+    create_key_index(cur)
+    try:
+        cur.execute(APPCOMPAT_QUERY, key_prefix_range(APPCOMPAT_KEY_PREFIX) + (APPCOMPAT_KEY_PATTERN,))
+        for row in cur:
+            yield row[0], row[1], row[2]
+    finally:
+        cur.close()
+
+
+def transform(obj):
     shimcache_infos = {
         v["name"].lower(): v["data"]
         for v in obj.get("values", [])
@@ -51,53 +113,187 @@ def transform(obj):
 
     cache_bin = shimcache_infos.get('appcompatcache', None)
     if cache_bin:
+        yield from parse_appcompatcache(obj["key"], cache_bin)
+
 
+def decode_value_data(data):
+    """ Decode the hex data of a registry value element, None if it cannot be decoded """
+    try:
+        return bytes.fromhex(data)
+    except ValueError as original_error:
         try:
-            cache_bin_bytes = bytearray.fromhex(cache_bin)
-        except ValueError as original_error:
-            try:
-                cache_bin_bytes = b64decode(cache_bin)
-                LOGGER.info("Base64 encoded registry value is deprecated!")
-            except ValueError:
-                LOGGER.error("Could not parse shimcache: %s", original_error)
-                return []
-        parsed_cache = read_cache(cache_bin_bytes)
-        if not parsed_cache:
-            return []
-        for entry in parsed_cache:
-            if entry not in entries:
-                control_set = obj["key"].split('\\')[2]
-                entry.append(control_set)
-                entries.append(entry)
-
-    result_obj = []
-    for entry in entries:
-        result_obj.append({
+            decoded = b64decode(data)
+            LOGGER.info("Base64 encoded registry value is deprecated!")
+            return decoded
+        except ValueError:
+            LOGGER.error("Could not decode registry value: %s", original_error)
+            return None
+
+
+def parse_appcompatcache(key, cache_bin, time_format=TIME_FORMAT_ISO):
+    cache_bin_bytes = decode_value_data(cache_bin)
+    if cache_bin_bytes is None:
+        return
+
+    # All rows of this key share its control set
+    control_set = key.split('\\')[2]
+    for entry in read_cache(cache_bin_bytes):
+        yield {
             'type': 'shimcache',
-            'Binary Last Modified': entry[0],
-            'Last Update': entry[1],
-            'Path': entry[2],
-            'Size': entry[3],
-            'Executed': entry[4],
-            'Source Key': entry[5],
-        })
-    return result_obj
+            'Binary Last Modified': format_filetime(entry.last_modified, time_format),
+            'Last Update': format_filetime(entry.last_update, time_format),
+            'Path': entry.path,
+            'Size': entry.size,
+            'Executed': entry.exec_flag,
+            'Source Key': control_set,
+        }
+
+
+def store_results(store, time_format=TIME_FORMAT_ISO):
+    """ Yield the parsed shimcache rows of all control sets in the store """
+    for _, key, cache_bin in select_appcompatcache(store):
+        if not cache_bin:
+            continue
+        yield from parse_appcompatcache(key, cache_bin, time_format)
+
+
+def insert_results(store, results):
+    """
+    Insert rows into the store in a single transaction. Empty values are
+    discarded like ForensicStore.insert does, but the schema validation and
+    view update only run once per type and set of fields.
+    """
+    if not results:
+        return
+    now = datetime.datetime.utcnow().isoformat(timespec='milliseconds') + 'Z'
+    rows = []
+    shapes = {}
+    for result in results:
+        result['id'] = result['type'] + '--' + str(uuid.uuid4())
+        element = {k: v for k, v in result.items() if v is not None and not (isinstance(v, list) and not v)}
+        shape = (element['type'], frozenset(element))
+        if shape not in shapes:
+            validation_errors = store.validate_element_schema(element)
+            if validation_errors:
+                raise TypeError("element could not be validated", validation_errors)
+            shapes[shape] = element
+        rows.append((element['id'], json.dumps(element), now))
+    with store.connection:
+        store.connection.executemany(INSERT_QUERY, rows)
+    for element in shapes.values():
+        store.update_views(element['type'], element)
+
+
+def write_results(store, time_format=TIME_FORMAT_ISO):
+    """ Write the parsed rows back into the store, linked to their registry key element """
+    # the cache values are fetched first, the store must not change while they are read
+    for key_id, key, cache_bin in list(select_appcompatcache(store)):
+        if not cache_bin:
+            continue
+        results = list(parse_appcompatcache(key, cache_bin, time_format))
+        for result in results:
+            result['registry_key_ref'] = key_id
+        insert_results(store, results)
 
 
-def main(url):
+def main(url, time_format=TIME_FORMAT_ISO, write=False):
     store = forensicstore.open(url)
-    conditions = [{
-        'key':
-            "HKEY_LOCAL_MACHINE\\System\\%ControlSet%\\Control\\Session Manager\\AppCompat%"
-    }]
-    items = store.select(conditions)
-    for item in items:
-        results = transform(item)
-        for result in results:
+    if write:
+        write_results(store, time_format)
+    else:
+        for result in store_results(store, time_format):
             print(json.dumps(result))
     store.close()
 
 
+def list_stores(path):
+    """
+    Return the forensicstores to process in batch mode. path is either a
+    directory containing forensicstores or a manifest file with one store
+    path per line, relative paths are relative to the manifest.
+    """
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path)
+                      if name.endswith(".forensicstore"))
+
+    stores = []
+    with open(path) as manifest:
+        for line in manifest:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                stores.append(os.path.join(os.path.dirname(path), line))
+    return stores
+
+
+def parse_store(url, time_format=TIME_FORMAT_ISO):
+    """ Parse a single store in a batch worker, rows are tagged with the host name """
+    host = os.path.splitext(os.path.basename(url))[0]
+    try:
+        store = forensicstore.open(url)
+        try:
+            results = list(store_results(store, time_format))
+        finally:
+            store.close()
+    except Exception as err:
+        return url, [], str(err)
+
+    for result in results:
+        result['host'] = host
+    return url, results, None
+
+
+def parse_stores(urls, workers=None, time_format=TIME_FORMAT_ISO):
+    """
+    Parse many stores in a process pool and yield the url and rows of every
+    store that could be parsed, in the order they finish. At most two stores
+    per worker are in flight, so memory does not grow with the number of stores.
+    """
+    workers = workers or os.cpu_count() or 1
+    urls = iter(urls)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        while True:
+            for url in urls:
+                pending.add(executor.submit(parse_store, url, time_format))
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                url, results, error = future.result()
+                if error:
+                    LOGGER.error("Could not parse shimcache of %s: %s", url, error)
+                    continue
+                yield url, results
+
+
+def batch(urls, output=None, workers=None, time_format=TIME_FORMAT_ISO):
+    """
+    Parse many stores in a process pool and write all rows to a single JSONL
+    stream or, if output ends with .forensicstore, into a new store.
+    """
+    store = None
+    out = sys.stdout
+    if output and output.endswith(".forensicstore"):
+        store = forensicstore.new(output)
+    elif output:
+        out = open(output, "w")
+
+    try:
+        for _, results in parse_stores(urls, workers, time_format):
+            if store:
+                insert_results(store, results)
+                continue
+            for result in results:
+                out.write(json.dumps(result) + "\n")
+    finally:
+        if store:
+            store.close()
+        elif out is not sys.stdout:
+            out.close()
+
+
 # Values used by Windows 5.2 and 6.0 (Server 2003 through Vista/Server 2008)
 CACHE_MAGIC_NT5_2 = 0xbadc0ffe
 CACHE_HEADER_SIZE_NT5_2 = 0x8
@@ -131,6 +327,35 @@ WIN10_MAGIC = '10ts'.encode('utf-8')
 CACHE_HEADER_SIZE_NT6_4 = 0x30
 CACHE_MAGIC_NT6_4 = 0x30
 
+# Entry layouts of Windows 5.2 and 6.0, 32-bit and 64-bit
+NT5_ENTRY32 = binrecord.Record('Nt5Entry32', [
+    ('wLength', 'H'), ('wMaximumLength', 'H'), ('Offset', 'L'),
+    ('dwLowDateTime', 'L'), ('dwHighDateTime', 'L'), ('dwFileSizeLow', 'L'), ('dwFileSizeHigh', 'L')])
+NT5_ENTRY64 = binrecord.Record('Nt5Entry64', [
+    ('wLength', 'H'), ('wMaximumLength', 'H'), (None, '4x'), ('Offset', 'Q'),
+    ('dwLowDateTime', 'L'), ('dwHighDateTime', 'L'), ('dwFileSizeLow', 'L'), ('dwFileSizeHigh', 'L')])
+
+# Entry layouts of Windows 6.1, 32-bit and 64-bit
+NT6_ENTRY32 = binrecord.Record('Nt6Entry32', [
+    ('wLength', 'H'), ('wMaximumLength', 'H'), ('Offset', 'L'),
+    ('dwLowDateTime', 'L'), ('dwHighDateTime', 'L'), ('FileFlags', 'L'), ('Flags', 'L'),
+    ('BlobSize', 'L'), ('BlobOffset', 'L')])
+NT6_ENTRY64 = binrecord.Record('Nt6Entry64', [
+    ('wLength', 'H'), ('wMaximumLength', 'H'), (None, '4x'), ('Offset', 'Q'),
+    ('dwLowDateTime', 'L'), ('dwHighDateTime', 'L'), ('FileFlags', 'L'), ('Flags', 'L'),
+    ('BlobSize', 'Q'), ('BlobOffset', 'Q')])
+
+# Entry data following the fixed size path of Windows XP entries
+WINXP_ENTRY_DATA = binrecord.Record('WinXPEntryData', [
+    ('LastModified', 'Q'), ('FileSize', 'L'), (None, '4x'), ('LastUpdate', 'Q')])
+
+# Layouts shared by the Windows 8 and 10 readers
+ENTRY_HEADER = binrecord.Record('EntryHeader', [('Magic', '4s'), ('Crc32', 'L'), ('Length', 'L')])
+WIN8_ENTRY_DATA = binrecord.Record('Win8EntryData', [
+    ('Flags', 'L'), (None, '4x'), ('LastModified', 'Q'), (None, '4x')])
+FILETIME = binrecord.Record('Filetime', [('FileTime', 'Q')])
+UINT16 = binrecord.Record('Uint16', [('Value', 'H')])
+
 bad_entry_data = 'N/A'
 g_verbose = False
 g_usebom = False
@@ -143,87 +368,59 @@ DATE_MDY = "%m/%d/%y %H:%M:%S"
 DATE_ISO = "%Y-%m-%d %H:%M:%S"
 g_timeformat = DATE_ISO
 
-
-# Shim Cache format used by Windows 5.2 and 6.0 (Server 2003 through Vista/Server 2008)
-class CacheEntryNt5(object):
-    def __init__(self, is32bit, data=None):
-
-        self.is32bit = is32bit
-        if data != None:
-            self.update(data)
-
-    def update(self, data):
-
-        if self.is32bit:
-            entry = struct.unpack('<2H 3L 2L', data)
-        else:
-            entry = struct.unpack('<2H 4x Q 2L 2L', data)
-        self.wLength = entry[0]
-        self.wMaximumLength = entry[1]
-        self.Offset = entry[2]
-        self.dwLowDateTime = entry[3]
-        self.dwHighDateTime = entry[4]
-        self.dwFileSizeLow = entry[5]
-        self.dwFileSizeHigh = entry[6]
-
-    def size(self):
-
-        if self.is32bit:
-            return NT5_2_ENTRY_SIZE32
-        else:
-            return NT5_2_ENTRY_SIZE64
-
-
-# Shim Cache format used by Windows 6.1 (Win7 through Server 2008 R2)
-class CacheEntryNt6(object):
-    def __init__(self, is32bit, data=None):
-
-        self.is32bit = is32bit
-        if data != None:
-            self.update(data)
-
-    def update(self, data):
-
-        if self.is32bit:
-            entry = struct.unpack('<2H 7L', data)
-        else:
-            entry = struct.unpack('<2H 4x Q 4L 2Q', data)
-        self.wLength = entry[0]
-        self.wMaximumLength = entry[1]
-        self.Offset = entry[2]
-        self.dwLowDateTime = entry[3]
-        self.dwHighDateTime = entry[4]
-        self.FileFlags = entry[5]
-        self.Flags = entry[6]
-        self.BlobSize = entry[7]
-        self.BlobOffset = entry[8]
-
-    def size(self):
-
-        if self.is32bit:
-            return NT6_1_ENTRY_SIZE32
-        else:
-            return NT6_1_ENTRY_SIZE64
-
-
-# Convert FILETIME to datetime.
-# Based on http://code.activestate.com/recipes/511425-filetime-to-datetime/
-def convert_filetime(dwLowDateTime, dwHighDateTime):
-    try:
-        date = datetime.datetime(1601, 1, 1, 0, 0, 0)
-        temp_time = dwHighDateTime
-        temp_time <<= 32
-        temp_time |= dwLowDateTime
-        return date + datetime.timedelta(microseconds=temp_time / 10)
-    except OverflowError as err:
-        return None
-
-
-# Read the Shim Cache format, return a list of last modified dates/paths.
+# FILETIME counts 100ns intervals since 1601-01-01
+FILETIME_EPOCH = datetime.datetime(1601, 1, 1)
+FILETIME_TICKS = 10000000
+FILETIME_UNIX_EPOCH_SECONDS = 11644473600
+# Last second representable as datetime (9999-12-31 23:59:59)
+FILETIME_MAX = (datetime.datetime.max - FILETIME_EPOCH).days * 86400 * FILETIME_TICKS + \
+               (86400 * FILETIME_TICKS - 1)
+
+# A single parsed cache entry. Entries are hashable tuples, so duplicates can be
+# dropped with a set lookup instead of comparing against every previous row.
+# Timestamps are kept as raw FILETIME values and only formatted on output.
+ShimcacheEntry = collections.namedtuple(
+    'ShimcacheEntry',
+    ['last_modified', 'last_update', 'path', 'size', 'exec_flag'])
+
+
+# Drop repeated entries while keeping the order in which they were first seen.
+def unique_entries(entries):
+    seen = set()
+    for entry in entries:
+        if entry not in seen:
+            seen.add(entry)
+            yield entry
+
+
+# Format a raw FILETIME for output. Values that are not timestamps, like
+# bad_entry_data, are returned unchanged.
+def format_filetime(filetime, time_format=TIME_FORMAT_ISO):
+    if not isinstance(filetime, int):
+        return filetime
+    if time_format == TIME_FORMAT_RAW:
+        return filetime
+    if filetime > FILETIME_MAX:
+        return bad_entry_data
+    seconds = filetime // FILETIME_TICKS
+    if time_format == TIME_FORMAT_EPOCH:
+        return seconds - FILETIME_UNIX_EPOCH_SECONDS
+    return _format_seconds(seconds, g_timeformat)
+
+
+# Caches and control sets repeat the same timestamps a lot, so the strftime
+# result is cached per second.
+@functools.lru_cache(maxsize=65536)
+def _format_seconds(seconds, date_format):
+    return (FILETIME_EPOCH + datetime.timedelta(seconds=seconds)).strftime(date_format)
+
+
+# Read the Shim Cache format, yield the entries with last modified dates/paths.
+# Formats that can contain the same entry more than once are deduplicated.
 def read_cache(cachebin, quiet=False):
     if len(cachebin) < 16:
         # Data size less than minimum header size.
-        return None
+        return
 
     try:
         # Get the format type
@@ -244,8 +441,7 @@ def read_cache(cachebin, quiet=False):
                     LOGGER.debug(
                         "[+] Found 64bit Windows 2k3/Vista/2k8 Shim Cache data..."
                     )
-                entry = CacheEntryNt5(False)
-                return read_nt5_entries(cachebin, entry)
+                yield from unique_entries(read_nt5_entries(cachebin, NT5_ENTRY64))
 
             # Otherwise it's 32-bit data.
             else:
@@ -253,8 +449,7 @@ def read_cache(cachebin, quiet=False):
                     LOGGER.debug(
                         "[+] Found 32bit Windows 2k3/Vista/2k8 Shim Cache data..."
                     )
-                entry = CacheEntryNt5(True)
-                return read_nt5_entries(cachebin, entry)
+                yield from unique_entries(read_nt5_entries(cachebin, NT5_ENTRY32))
 
         # This is a Windows 7/2k8-R2 Shim Cache.
         elif magic == CACHE_MAGIC_NT6_1:
@@ -276,41 +471,39 @@ def read_cache(cachebin, quiet=False):
                 if not quiet:
                     LOGGER.debug(
                         "[+] Found 64bit Windows 7/2k8-R2 Shim Cache data...")
-                entry = CacheEntryNt6(False)
-                return read_nt6_entries(cachebin, entry)
+                yield from unique_entries(read_nt6_entries(cachebin, NT6_ENTRY64))
             else:
                 if not quiet:
                     LOGGER.debug(
                         "[+] Found 32bit Windows 7/2k8-R2 Shim Cache data...")
-                entry = CacheEntryNt6(True)
-                return read_nt6_entries(cachebin, entry)
+                yield from unique_entries(read_nt6_entries(cachebin, NT6_ENTRY32))
 
         # This is WinXP cache data
         elif magic == WINXP_MAGIC32:
             if not quiet:
                 LOGGER.debug("[+] Found 32bit Windows XP Shim Cache data...")
-            return read_winxp_entries(cachebin)
+            yield from unique_entries(read_winxp_entries(cachebin))
 
         # Check the data set to see if it matches the Windows 8 format.
         elif len(cachebin) > WIN8_STATS_SIZE and cachebin[
                                                  WIN8_STATS_SIZE:WIN8_STATS_SIZE + 4] == WIN8_MAGIC:
             if not quiet:
                 LOGGER.debug("[+] Found Windows 8/2k12 Apphelp Cache data...")
-            return read_win8_entries(cachebin, WIN8_MAGIC)
+            yield from read_win8_entries(cachebin, WIN8_MAGIC)
 
         # Windows 8.1 will use a different magic dword, check for it
         elif len(cachebin) > WIN8_STATS_SIZE and cachebin[
                                                  WIN8_STATS_SIZE:WIN8_STATS_SIZE + 4] == WIN81_MAGIC:
             if not quiet:
                 LOGGER.debug("[+] Found Windows 8.1 Apphelp Cache data...")
-            return read_win8_entries(cachebin, WIN81_MAGIC)
+            yield from read_win8_entries(cachebin, WIN81_MAGIC)
 
         # Windows 10 will use a different magic dword, check for it
         elif len(cachebin) > WIN10_STATS_SIZE and cachebin[
                                                   WIN10_STATS_SIZE:WIN10_STATS_SIZE + 4] == WIN10_MAGIC:
             if not quiet:
                 LOGGER.debug("[+] Found Windows 10 Apphelp Cache data...")
-            return read_win10_entries(cachebin, WIN10_MAGIC)
+            yield from read_win10_entries(cachebin, WIN10_MAGIC)
 
         # Windows 10 Creators Update will use a different STATS_SIZE, account for it
         elif len(cachebin) > WIN10_CREATORS_STATS_SIZE and \
@@ -319,60 +512,42 @@ def read_cache(cachebin, quiet=False):
                 LOGGER.debug(
                     "[+] Found Windows 10 Creators Update Apphelp Cache data..."
                 )
-            return read_win10_entries(cachebin,
-                                      WIN10_MAGIC,
-                                      creators_update=True)
+            yield from read_win10_entries(cachebin,
+                                          WIN10_MAGIC,
+                                          creators_update=True)
 
         else:
             LOGGER.debug(
                 "[-] Got an unrecognized magic value of 0x%x... bailing" %
                 magic)
-            return None
 
     except (RuntimeError, TypeError, NameError) as err:
         LOGGER.debug("[-] Error reading Shim Cache data: %s" % err)
-        return None
 
 
 # Read Windows 8/2k12/8.1 Apphelp Cache entry formats.
 def read_win8_entries(bin_data, ver_magic):
-    offset = 0
-    entry_meta_len = 12
-    entry_list = []
+    data = memoryview(bin_data)
 
     # Skip past the stats in the header
-    cache_data = bin_data[WIN8_STATS_SIZE:]
-
-    data = sio.BytesIO(cache_data)
-    while data.tell() < len(cache_data):
-        header = data.read(entry_meta_len)
-        # Read in the entry metadata
-        # Note: the crc32 hash is of the cache entry data
-        magic, crc32_hash, entry_len = struct.unpack('<4sLL', header)
-
-        # Check the magic tag
-        if magic != ver_magic:
-            raise Exception("Invalid version magic tag found: 0x%x" %
-                            struct.unpack("<L", magic)[0])
-
-        entry_data = sio.BytesIO(data.read(entry_len))
-
+    # Note: the crc32 hash in the entry header is of the cache entry data
+    for pos, _ in binrecord.iter_tagged(data, WIN8_STATS_SIZE, ENTRY_HEADER, ver_magic):
         # Read the path length
-        path_len = struct.unpack('<H', entry_data.read(2))[0]
+        path_len = UINT16.unpack_from(data, pos)[0]
+        pos += UINT16.size
         if path_len == 0:
             path = 'None'
         else:
-            path = entry_data.read(path_len).decode('utf-16le', 'replace')
+            path = binrecord.utf16(data, pos, path_len)
+        pos += path_len
 
         # Check for package data
-        package_len = struct.unpack('<H', entry_data.read(2))[0]
-        if package_len > 0:
-            # Just skip past the package data if present (for now)
-            entry_data.seek(package_len, 1)
+        package_len = UINT16.unpack_from(data, pos)[0]
+        # Just skip past the package data if present (for now)
+        pos += UINT16.size + package_len
 
         # Read the remaining entry data
-        flags, unk_1, low_datetime, high_datetime, unk_2 = struct.unpack(
-            '<LLLLL', entry_data.read(20))
+        flags, last_mod_date = WIN8_ENTRY_DATA.unpack_from(data, pos)
 
         # Check the flag set in CSRSS
         if (flags & CSRSS_FLAG):
@@ -380,195 +555,121 @@ def read_win8_entries(bin_data, ver_magic):
         else:
             exec_flag = 'False'
 
-        last_mod_date = convert_filetime(low_datetime, high_datetime)
-        try:
-            last_mod_date = last_mod_date.strftime(g_timeformat)
-        except ValueError:
-            last_mod_date = bad_entry_data
-
-        row = [last_mod_date, 'N/A', path, 'N/A', exec_flag]
-        entry_list.append(row)
-
-    return entry_list
+        yield ShimcacheEntry(last_mod_date, 'N/A', path, 'N/A', exec_flag)
 
 
 # Read Windows 10 Apphelp Cache entry format
 def read_win10_entries(bin_data, ver_magic, creators_update=False):
-    offset = 0
-    entry_meta_len = 12
-    entry_list = []
+    data = memoryview(bin_data)
 
     # Skip past the stats in the header
     if creators_update:
-        cache_data = bin_data[WIN10_CREATORS_STATS_SIZE:]
+        offset = WIN10_CREATORS_STATS_SIZE
     else:
-        cache_data = bin_data[WIN10_STATS_SIZE:]
-
-    data = sio.BytesIO(cache_data)
-    while data.tell() < len(cache_data):
-        header = data.read(entry_meta_len)
-        # Read in the entry metadata
-        # Note: the crc32 hash is of the cache entry data
-        magic, crc32_hash, entry_len = struct.unpack('<4sLL', header)
-
-        # Check the magic tag
-        if magic != ver_magic:
-            raise Exception("Invalid version magic tag found: 0x%x" %
-                            struct.unpack("<L", magic)[0])
-
-        entry_data = sio.BytesIO(data.read(entry_len))
+        offset = WIN10_STATS_SIZE
 
+    # Note: the crc32 hash in the entry header is of the cache entry data
+    for pos, _ in binrecord.iter_tagged(data, offset, ENTRY_HEADER, ver_magic):
         # Read the path length
-        path_len = struct.unpack('<H', entry_data.read(2))[0]
+        path_len = UINT16.unpack_from(data, pos)[0]
+        pos += UINT16.size
         if path_len == 0:
             path = 'None'
         else:
-            path = entry_data.read(path_len).decode('utf-16le', 'replace')
+            path = binrecord.utf16(data, pos, path_len)
+        pos += path_len
 
         # Read the remaining entry data
-        low_datetime, high_datetime = struct.unpack('<LL', entry_data.read(8))
-
-        last_mod_date = convert_filetime(low_datetime, high_datetime)
-        try:
-            last_mod_date = last_mod_date.strftime(g_timeformat)
-        except ValueError:
-            last_mod_date = bad_entry_data
+        last_mod_date = FILETIME.unpack_from(data, pos)[0]
 
         # Skip the unrecognized Microsoft App entry format for now
-        if last_mod_date == bad_entry_data:
+        if last_mod_date > FILETIME_MAX:
             continue
 
-        row = [last_mod_date, 'N/A', path, 'N/A', 'N/A']
-        entry_list.append(row)
-
-    return entry_list
+        yield ShimcacheEntry(last_mod_date, 'N/A', path, 'N/A', 'N/A')
 
 
 # Read Windows 2k3/Vista/2k8 Shim Cache entry formats.
-def read_nt5_entries(bin_data, entry):
+def read_nt5_entries(bin_data, layout):
     try:
-        entry_list = []
-        contains_file_size = False
-        entry_size = entry.size()
-        exec_flag = ''
-
         num_entries = struct.unpack('<L', bin_data[4:8])[0]
         if num_entries == 0:
-            return None
+            return
 
         # On Windows Server 2008/Vista, the filesize is swapped out of this
         # structure with two 4-byte flags. Check to see if any of the values in
         # "dwFileSizeLow" are larger than 2-bits. This indicates the entry contained file sizes.
-        for offset in range(CACHE_HEADER_SIZE_NT5_2,
-                            (num_entries * entry_size) +
-                            CACHE_HEADER_SIZE_NT5_2, entry_size):
-
-            entry.update(bin_data[offset:offset + entry_size])
-
-            if entry.dwFileSizeLow > 3:
-                contains_file_size = True
-                break
+        contains_file_size = any(
+            entry[5] > 3 for entry in layout.iter_unpack(bin_data, CACHE_HEADER_SIZE_NT5_2, num_entries))
 
         # Now grab all the data in the value.
-        for offset in range(CACHE_HEADER_SIZE_NT5_2,
-                            (num_entries * entry_size) +
-                            CACHE_HEADER_SIZE_NT5_2, entry_size):
-
-            entry.update(bin_data[offset:offset + entry_size])
-
-            last_mod_date = convert_filetime(entry.dwLowDateTime,
-                                             entry.dwHighDateTime)
-            try:
-                last_mod_date = last_mod_date.strftime(g_timeformat)
-            except ValueError:
-                last_mod_date = bad_entry_data
-            path = bin_data[entry.Offset:entry.Offset + entry.wLength].decode(
-                'utf-16le', 'replace')
+        for wLength, _, Offset, dwLowDateTime, dwHighDateTime, dwFileSizeLow, _ in \
+                layout.iter_unpack(bin_data, CACHE_HEADER_SIZE_NT5_2, num_entries):
+
+            last_mod_date = dwHighDateTime << 32 | dwLowDateTime
+            path = binrecord.utf16(bin_data, Offset, wLength)
             path = path.replace("\\??\\", "")
 
             # It contains file size data.
             if contains_file_size:
-                hit = [
+                yield ShimcacheEntry(
                     last_mod_date, 'N/A', path,
-                    str(entry.dwFileSizeLow), 'N/A'
-                ]
-                if hit not in entry_list:
-                    entry_list.append(hit)
+                    str(dwFileSizeLow), 'N/A')
 
             # It contains flags.
             else:
                 # Check the flag set in CSRSS
-                if (entry.dwFileSizeLow & CSRSS_FLAG):
+                if (dwFileSizeLow & CSRSS_FLAG):
                     exec_flag = 'True'
                 else:
                     exec_flag = 'False'
 
-                hit = [last_mod_date, 'N/A', path, 'N/A', exec_flag]
-                if hit not in entry_list:
-                    entry_list.append(hit)
-
-        return entry_list
+                yield ShimcacheEntry(
+                    last_mod_date, 'N/A', path, 'N/A', exec_flag)
 
     except (RuntimeError, ValueError, NameError) as err:
         LOGGER.debug("[-] Error reading Shim Cache data: %s..." % err)
-        return None
 
 
 # Read the Shim Cache Windows 7/2k8-R2 entry format,
-# return a list of last modifed dates/paths.
-def read_nt6_entries(bin_data, entry):
+# yield last modifed dates/paths.
+def read_nt6_entries(bin_data, layout):
     try:
-        entry_list = []
-        exec_flag = ""
-        entry_size = entry.size()
         num_entries = struct.unpack('<L', bin_data[4:8])[0]
 
         if num_entries == 0:
-            return None
+            return
 
         # Walk each entry in the data structure.
-        for offset in range(CACHE_HEADER_SIZE_NT6_1,
-                            num_entries * entry_size + CACHE_HEADER_SIZE_NT6_1,
-                            entry_size):
-
-            entry.update(bin_data[offset:offset + entry_size])
-            last_mod_date = convert_filetime(entry.dwLowDateTime,
-                                             entry.dwHighDateTime)
-            try:
-                last_mod_date = last_mod_date.strftime(g_timeformat)
-            except ValueError:
-                last_mod_date = 'N/A'
-            path = bin_data[entry.Offset:entry.Offset + entry.wLength].decode(
-                'utf-16le', 'replace')
+        for wLength, _, Offset, dwLowDateTime, dwHighDateTime, FileFlags, _, _, _ in \
+                layout.iter_unpack(bin_data, CACHE_HEADER_SIZE_NT6_1, num_entries):
+
+            last_mod_date = dwHighDateTime << 32 | dwLowDateTime
+            path = binrecord.utf16(bin_data, Offset, wLength)
             path = path.replace("\\??\\", "")
 
             # Test to see if the file may have been executed.
-            if entry.FileFlags & CSRSS_FLAG:
+            if FileFlags & CSRSS_FLAG:
                 exec_flag = 'True'
             else:
                 exec_flag = 'False'
 
-            hit = [last_mod_date, 'N/A', path, 'N/A', exec_flag]
-
-            if hit not in entry_list:
-                entry_list.append(hit)
-        return entry_list
+            yield ShimcacheEntry(
+                last_mod_date, 'N/A', path, 'N/A', exec_flag)
 
     except (RuntimeError, ValueError, NameError) as err:
         LOGGER.debug('[-] Error reading Shim Cache data: %s...' % err)
-        return None
 
 
 # Read the WinXP Shim Cache data. Some entries can be missing data but still
 # contain useful information, so try to get as much as we can.
 def read_winxp_entries(bin_data):
-    entry_list = []
 
     try:
 
         num_entries = struct.unpack('<L', bin_data[8:12])[0]
         if num_entries == 0:
-            return None
+            return
 
         for offset in range(WINXP_HEADER_SIZE32,
                             (num_entries * WINXP_ENTRY_SIZE32) +
@@ -587,42 +688,55 @@ def read_winxp_entries(bin_data):
             path = path.replace('\\??\\', '')
             if len(path) == 0: continue
 
-            entry_data = (offset + (MAX_PATH + 8))
-
-            # Get last mod time.
-            last_mod_time = struct.unpack('<2L',
-                                          bin_data[entry_data:entry_data + 8])
-            try:
-                last_mod_time = convert_filetime(
-                    last_mod_time[0], last_mod_time[1]).strftime(g_timeformat)
-            except ValueError:
-                last_mod_time = 'N/A'
-
-            # Get last file size.
-            file_size = struct.unpack('<2L', bin_data[entry_data +
-                                                      8:entry_data + 16])[0]
+            # Get last mod time, last file size and last update time.
+            last_mod_time, file_size, exec_time = WINXP_ENTRY_DATA.unpack_from(
+                bin_data, offset + (MAX_PATH + 8))
             if file_size == 0:
                 file_size = bad_entry_data
 
-            # Get last update time.
-            exec_time = struct.unpack(
-                '<2L', bin_data[entry_data + 16:entry_data + 24])
-            try:
-                exec_time = convert_filetime(
-                    exec_time[0], exec_time[1]).strftime(g_timeformat)
-            except ValueError:
-                exec_time = bad_entry_data
-
-            hit = [last_mod_time, exec_time, path, file_size, 'N/A']
-            if hit not in entry_list:
-                entry_list.append(hit)
-        return entry_list
+            yield ShimcacheEntry(
+                last_mod_time, exec_time, path, file_size, 'N/A')
 
     except (RuntimeError, ValueError, NameError) as err:
         LOGGER.debug("[-] Error reading Shim Cache data %s" % err)
-        return None
 
 
 if __name__ == '__main__':
-    os.symlink("/input/forensicstore", "/input/input.forensicstore")
-    main("input.forensicstore")
+    parser = argparse.ArgumentParser(description="Parse the shimcache from forensicstores")
+    parser.add_argument("--batch", help="directory or manifest file of forensicstores to process")
+    parser.add_argument("--workers", type=int, help="number of worker processes in batch mode")
+    parser.add_argument("--output", help="JSONL file or .forensicstore for batch results (default: stdout)")
+    parser.add_argument("--time-format", dest="time_format", choices=TIME_FORMATS, default=TIME_FORMAT_ISO,
+                        help="output timestamps formatted, as raw FILETIME or as Unix epoch seconds")
+    parser.add_argument("--write", action="store_true",
+                        help="insert the results into the forensicstore instead of printing them")
+    parser.add_argument("--execution", action="store_true",
+                        help="also parse BAM/DAM and UserAssist, in the same pass as the shimcache")
+    parser.add_argument("--index", help="SQLite correlation index, built from --batch or queried with --query")
+    parser.add_argument("--query", help="print the hosts that have this path in their shimcache")
+    parser.add_argument("--executed", action="store_true", help="only return hosts that executed the --query path")
+    parser.add_argument("--by-control-set", dest="by_control_set", action="store_true",
+                        help="return one --query result per host and control set")
+    args, _ = parser.parse_known_args(sys.argv[1:])
+
+    if args.index:
+        import shimcache_index
+
+        if args.batch:
+            shimcache_index.build_index(args.index, list_stores(args.batch), args.workers)
+        if args.query:
+            index = shimcache_index.ShimcacheIndex(args.index)
+            lookup = index.control_sets if args.by_control_set else index.hosts
+            for host in lookup(args.query, args.executed, args.time_format):
+                print(json.dumps(host))
+            index.close()
+    elif args.batch:
+        batch(list_stores(args.batch), args.output, args.workers, args.time_format)
+    else:
+        os.symlink("/input/forensicstore", "/input/input.forensicstore")
+        if args.execution:
+            import execution_artifacts
+
+            execution_artifacts.main("input.forensicstore", args.time_format, args.write)
+        else:
+            main("input.forensicstore", args.time_format, args.write)
@@ -0,0 +1,125 @@
+# Copyright (c) 2020 Siemens AG
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Index of shimcache paths over many hosts, to find where a binary was seen without re-parsing stores """
+
+import logging
+import sqlite3
+
+import shimcache
+
+LOGGER = logging.getLogger(__name__)
+
+# exec flags are stored as integers so they can be merged with max()
+EXECUTED = {'True': 1, 'False': 0}
+EXECUTED_UNKNOWN = -1
+
+
+def normalize_path(path):
+    """ Normalize a shimcache path for lookups """
+    return path.strip().replace('/', '\\').casefold()
+
+
+def _row(first_seen, last_seen, executed, time_format):
+    return {
+        'first_seen': shimcache.format_filetime(first_seen, time_format),
+        'last_seen': shimcache.format_filetime(last_seen, time_format),
+        'executed': {1: True, 0: False}.get(executed),
+    }
+
+
+class ShimcacheIndex:
+    """
+    SQLite backed index from normalized path to the hosts and control sets
+    that have it in their shimcache, with first and last seen modification
+    time and whether it was executed. Use ":memory:" as url for an in-memory
+    index.
+    """
+
+    def __init__(self, url=":memory:"):
+        self.connection = sqlite3.connect(url)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS shimcache_index ("
+            "path TEXT NOT NULL, "
+            "host TEXT NOT NULL, "
+            "control_set TEXT NOT NULL, "
+            "first_seen INTEGER, "
+            "last_seen INTEGER, "
+            "executed INTEGER NOT NULL, "
+            "PRIMARY KEY (path, host, control_set)"
+            ") WITHOUT ROWID")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS shimcache_index_host ON shimcache_index(host)")
+
+    def add(self, host, results):
+        """
+        Add the shimcache rows of one host. The rows must have been parsed
+        with shimcache.TIME_FORMAT_RAW.
+        """
+        rows = []
+        for result in results:
+            modified = result['Binary Last Modified']
+            if not isinstance(modified, int):
+                modified = None
+            rows.append((normalize_path(result['Path']), host, result.get('Source Key', ''), modified, modified,
+                         EXECUTED.get(result['Executed'], EXECUTED_UNKNOWN)))
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO shimcache_index (path, host, control_set, first_seen, last_seen, executed) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (path, host, control_set) DO UPDATE SET "
+                "first_seen = min(coalesce(first_seen, excluded.first_seen), "
+                "coalesce(excluded.first_seen, first_seen)), "
+                "last_seen = max(coalesce(last_seen, excluded.last_seen), "
+                "coalesce(excluded.last_seen, last_seen)), "
+                "executed = max(executed, excluded.executed)", rows)
+
+    def hosts(self, path, executed=False, time_format=shimcache.TIME_FORMAT_ISO):
+        """
+        Return the hosts that have path in their shimcache, merged over their
+        control sets, optionally only if it was executed
+        """
+        query = "SELECT host, group_concat(control_set), min(first_seen), max(last_seen), max(executed) " \
+                "FROM shimcache_index WHERE path = ?"
+        if executed:
+            query += " AND executed = 1"
+        cur = self.connection.execute(query + " GROUP BY host ORDER BY host", (normalize_path(path),))
+        return [dict(host=host, control_sets=sorted(control_sets.split(',')),
+                     **_row(first_seen, last_seen, host_executed, time_format))
+                for host, control_sets, first_seen, last_seen, host_executed in cur]
+
+    def control_sets(self, path, executed=False, time_format=shimcache.TIME_FORMAT_ISO):
+        """ Return every host and control set that has path in its shimcache, optionally only if it was executed """
+        query = "SELECT host, control_set, first_seen, last_seen, executed FROM shimcache_index WHERE path = ?"
+        if executed:
+            query += " AND executed = 1"
+        cur = self.connection.execute(query + " ORDER BY host, control_set", (normalize_path(path),))
+        return [dict(host=host, control_set=control_set, **_row(first_seen, last_seen, set_executed, time_format))
+                for host, control_set, first_seen, last_seen, set_executed in cur]
+
+    def close(self):
+        """ Close the index database """
+        self.connection.close()
+
+
+def build_index(url, store_urls, workers=None):
+    """ Parse many stores in a process pool and add their rows to the index at url """
+    index = ShimcacheIndex(url)
+    try:
+        for store_url, results in shimcache.parse_stores(store_urls, workers, shimcache.TIME_FORMAT_RAW):
+            if results:
+                index.add(results[0]['host'], results)
+            LOGGER.info("Indexed %d shimcache entries of %s", len(results), store_url)
+    finally:
+        index.close()
@@ -14,14 +14,25 @@
 #
 # Author(s): Jonas Plum
 
+import codecs
+import json
 import os
 import shutil
+import struct
 import sys
 import tempfile
 from io import StringIO
 
+import binrecord
+import cache_generator
+import execution_artifacts
+import forensicstore
 import pytest
 import shimcache
+import shimcache_index
+
+
+APPCOMPAT_KEY = "HKEY_LOCAL_MACHINE\\System\\ControlSet001\\Control\\Session Manager\\AppCompatCache"
 
 
 @pytest.fixture
@@ -33,6 +44,34 @@ def data():
     return tmpdir
 
 
+@pytest.fixture
+def tmp():
+    tmpdir = tempfile.mkdtemp()
+    yield tmpdir
+    shutil.rmtree(tmpdir)
+
+
+def add_appcompatcache(store, count, key=APPCOMPAT_KEY):
+    """ Add a registry key with a generated Windows 10 AppCompatCache of count entries """
+    key_id = store.add_registry_key_element("WindowsAppCompatCache", "2020-01-01T00:00:00Z", key, None)
+    store.add_registry_value_element(key_id, "REG_BINARY", cache_generator.win10_cache(count), "AppCompatCache")
+    return key_id
+
+
+def new_store(url, keys):
+    """ Create a store with AppCompatCache keys given as key -> number of entries """
+    store = forensicstore.new(url)
+    key_ids = [add_appcompatcache(store, count, key) for key, count in keys.items()]
+    store.close()
+    return key_ids
+
+
+def new_host_stores(tmpdir, hosts):
+    """ Create one store per host, given as host -> number of entries """
+    for host, count in hosts.items():
+        new_store(os.path.join(tmpdir, host + ".forensicstore"), {APPCOMPAT_KEY: count})
+
+
 def test_shimcache(data):
     cwd = os.getcwd()
     os.chdir(data)
@@ -49,3 +88,216 @@ def test_shimcache(data):
     sys.stdout = sys.__stdout__
     os.chdir(cwd)
     shutil.rmtree(data)
+
+
+def test_unique_entries():
+    first = shimcache.ShimcacheEntry("2020-01-01 00:00:00", "N/A", "C:\\a.exe", "N/A", "True")
+    second = shimcache.ShimcacheEntry("2020-01-02 00:00:00", "N/A", "C:\\b.exe", "N/A", "False")
+
+    assert list(shimcache.unique_entries([first, second, first, second])) == [first, second]
+
+
+def test_select_appcompatcache(tmp):
+    url = os.path.join(tmp, "input.forensicstore")
+    new_store(url, {
+        APPCOMPAT_KEY: 2,
+        "HKEY_LOCAL_MACHINE\\SYSTEM\\ControlSet002\\Control\\Session Manager\\AppCompatCache": 1,
+        "HKEY_LOCAL_MACHINE\\System\\ControlSet001\\Services\\AppCompatCache": 4,
+        "HKEY_LOCAL_MACHINE\\Software\\Microsoft\\AppCompatCache": 8,
+    })
+
+    store = forensicstore.open(url)
+    selected = list(shimcache.select_appcompatcache(store))
+    store.close()
+
+    assert sorted(key.split("\\")[2] for _, key, _ in selected) == ["ControlSet001", "ControlSet002"]
+    rows = [row for _, key, data in selected for row in shimcache.parse_appcompatcache(key, data)]
+    assert len(rows) == 3
+
+
+def test_select_appcompatcache_uses_index(tmp):
+    url = os.path.join(tmp, "input.forensicstore")
+    new_store(url, {APPCOMPAT_KEY: 1})
+
+    store = forensicstore.open(url)
+    list(shimcache.select_appcompatcache(store))
+    plan = store.connection.execute("EXPLAIN QUERY PLAN " + shimcache.APPCOMPAT_QUERY, (
+        shimcache.APPCOMPAT_KEY_PREFIX, "HKEY_LOCAL_MACHINE\\System]", shimcache.APPCOMPAT_KEY_PATTERN)).fetchall()
+    store.close()
+
+    details = [row[-1] for row in plan]
+    assert any("USING INDEX key_nocase_index" in detail for detail in details), details
+
+
+def test_batch(tmp):
+    new_host_stores(tmp, {"host1": 1, "host2": 2})
+
+    output = os.path.join(tmp, "results.jsonl")
+    shimcache.batch(shimcache.list_stores(tmp), output, workers=2)
+
+    with open(output) as results:
+        hosts = [json.loads(line)["host"] for line in results]
+
+    assert sorted(hosts) == ["host1", "host2", "host2"]
+
+
+def test_parse_stores(tmp):
+    new_host_stores(tmp, {"host%d" % i: 1 for i in range(6)})
+    with open(os.path.join(tmp, "zbroken.forensicstore"), "w") as broken:
+        broken.write("not a store")
+    pulled = []
+
+    def urls():
+        for url in shimcache.list_stores(tmp):
+            pulled.append(url)
+            yield url
+
+    parsed = shimcache.parse_stores(urls(), workers=1)
+    first_url, _ = next(parsed)
+    # only a window of two stores per worker is submitted ahead
+    assert len(pulled) <= 2
+    hosts = [os.path.basename(url) for url, _ in [(first_url, None)] + list(parsed)]
+
+    assert sorted(hosts) == ["host%d.forensicstore" % i for i in range(6)]
+
+
+def test_format_filetime():
+    filetime = 132000000000000000
+
+    assert shimcache.format_filetime(filetime) == "2019-04-17 18:40:00"
+    assert shimcache.format_filetime(filetime, shimcache.TIME_FORMAT_RAW) == filetime
+    assert shimcache.format_filetime(filetime, shimcache.TIME_FORMAT_EPOCH) == 1555526400
+    assert shimcache.format_filetime(shimcache.FILETIME_MAX + 1) == "N/A"
+    assert shimcache.format_filetime("N/A") == "N/A"
+
+
+def test_write_results(tmp):
+    url = os.path.join(tmp, "input.forensicstore")
+    key_id, = new_store(url, {APPCOMPAT_KEY: 2})
+
+    shimcache.main(url, write=True)
+
+    store = forensicstore.open(url)
+    items = list(store.select([{"type": "shimcache"}]))
+    store.close()
+
+    assert [item["Path"] for item in items] == [cache_generator.entry_path(0), cache_generator.entry_path(1)]
+    assert all(item["registry_key_ref"] == key_id for item in items)
+
+
+def test_insert_results(tmp):
+    url = os.path.join(tmp, "input.forensicstore")
+    store = forensicstore.new(url)
+    shimcache.insert_results(store, [
+        {"type": "shimcache", "Path": "a", "Executed": None, "tags": []},
+        {"type": "shimcache", "Path": "b", "Executed": True, "registry_key_ref": "windows-registry-key--1"},
+    ])
+    store.close()
+
+    store = forensicstore.open(url)
+    items = [json.loads(row[0]) for row in store.connection.execute("SELECT json FROM elements ORDER BY json")]
+    columns = [row[1] for row in store.connection.execute("PRAGMA table_info(shimcache)")]
+    store.close()
+
+    assert [sorted(item) for item in items] == [
+        ["Path", "id", "type"], ["Executed", "Path", "id", "registry_key_ref", "type"]]
+    assert "Executed" in columns and "registry_key_ref" in columns
+
+
+@pytest.mark.parametrize("cache_format", sorted(cache_generator.FORMATS))
+def test_read_cache(cache_format):
+    entries = list(shimcache.read_cache(cache_generator.FORMATS[cache_format](100)))
+
+    assert [entry.path for entry in entries] == [cache_generator.entry_path(i) for i in range(100)]
+    assert [entry.last_modified for entry in entries] == [cache_generator.entry_filetime(i) for i in range(100)]
+
+
+def test_iter_unpack_truncated(caplog):
+    record = binrecord.Record('Pair', [('First', 'H'), (None, '2x'), ('Second', 'L')])
+    data = struct.pack("<H2xLH2xL", 1, 2, 3, 4) + b"\x05\x00"
+
+    with caplog.at_level("DEBUG", logger="binrecord"):
+        assert list(record.iter_unpack(data, 0, 3)) == [(1, 2), (3, 4)]
+    assert "Skipping 1 truncated Pair records" in caplog.text
+
+
+def test_shimcache_index(tmp):
+    new_host_stores(tmp, {"host1": 1, "host2": 2})
+
+    url = os.path.join(tmp, "index.sqlite")
+    shimcache_index.build_index(url, shimcache.list_stores(tmp), workers=2)
+
+    index = shimcache_index.ShimcacheIndex(url)
+    first = index.hosts(cache_generator.entry_path(0).upper())
+    second = index.hosts(cache_generator.entry_path(1), time_format=shimcache.TIME_FORMAT_RAW)
+    index.add("host2", [
+        {'Path': cache_generator.entry_path(1), 'Binary Last Modified': 1, 'Executed': 'True',
+         'Source Key': "ControlSet002"},
+        {'Path': cache_generator.entry_path(1).replace('\\', '/'), 'Binary Last Modified': 'N/A', 'Executed': 'False',
+         'Source Key': "ControlSet002"},
+    ])
+    merged = index.hosts(cache_generator.entry_path(1), time_format=shimcache.TIME_FORMAT_RAW)
+    executed = index.hosts(cache_generator.entry_path(1), executed=True, time_format=shimcache.TIME_FORMAT_RAW)
+    control_sets = index.control_sets(cache_generator.entry_path(1), time_format=shimcache.TIME_FORMAT_RAW)
+    index.close()
+
+    assert [host['host'] for host in first] == ["host1", "host2"]
+    assert second == [{'host': "host2", 'control_sets': ["ControlSet001"],
+                       'first_seen': cache_generator.entry_filetime(1),
+                       'last_seen': cache_generator.entry_filetime(1), 'executed': None}]
+    assert merged == [{'host': "host2", 'control_sets': ["ControlSet001", "ControlSet002"], 'first_seen': 1,
+                       'last_seen': cache_generator.entry_filetime(1), 'executed': True}]
+    assert executed == [{'host': "host2", 'control_sets': ["ControlSet002"], 'first_seen': 1, 'last_seen': 1,
+                         'executed': True}]
+    assert control_sets == [
+        {'host': "host2", 'control_set': "ControlSet001", 'first_seen': cache_generator.entry_filetime(1),
+         'last_seen': cache_generator.entry_filetime(1), 'executed': None},
+        {'host': "host2", 'control_set': "ControlSet002", 'first_seen': 1, 'last_seen': 1, 'executed': True},
+    ]
+
+
+def test_execution_artifacts(tmp):
+    url = os.path.join(tmp, "input.forensicstore")
+    store = forensicstore.new(url)
+    add_appcompatcache(store, 1)
+    key = "HKEY_LOCAL_MACHINE\\System\\ControlSet001\\Services\\bam\\State\\UserSettings\\S-1-5-21-1"
+    key_id = store.add_registry_key_element("WindowsBAM", "2020-01-01T00:00:00Z", key, None)
+    store.add_registry_value_element(key_id, "REG_DWORD", struct.pack("<L", 1), "Version")
+    store.add_registry_value_element(key_id, "REG_BINARY", struct.pack("<Q16x", cache_generator.entry_filetime(0)),
+                                     cache_generator.entry_path(0))
+    key = "HKEY_USERS\\S-1-5-21-1\\Software\\Microsoft\\Windows\\CurrentVersion\\Explorer\\UserAssist\\" \
+          "{CEBFF5CD-ACE2-4F4F-9178-9926F41749EA}\\Count"
+    key_id = store.add_registry_key_element("WindowsUserAssist", "2020-01-01T00:00:00Z", key, None)
+    store.add_registry_value_element(key_id, "REG_BINARY", struct.pack("<4L44xQ4x", 0, 3, 2, 1000,
+                                                                       cache_generator.entry_filetime(1)),
+                                     codecs.encode(cache_generator.entry_path(1), "rot_13"))
+    store.close()
+
+    store = forensicstore.open(url)
+    results = list(execution_artifacts.store_results(store, shimcache.TIME_FORMAT_RAW))
+    store.close()
+
+    assert [(result["type"], result["Path"]) for result in results] == [
+        ("shimcache", cache_generator.entry_path(0)),
+        ("bam", cache_generator.entry_path(0)),
+        ("userassist", cache_generator.entry_path(1)),
+    ]
+    assert results[1]["Last Execution"] == cache_generator.entry_filetime(0)
+    assert results[1]["SID"] == "S-1-5-21-1"
+    assert results[2]["Last Execution"] == cache_generator.entry_filetime(1)
+    assert results[2]["Run Count"] == 3
+    assert results[2]["User"] == "S-1-5-21-1"
+
+
+def test_execution_artifacts_uses_index(tmp):
+    url = os.path.join(tmp, "input.forensicstore")
+    new_store(url, {APPCOMPAT_KEY: 1})
+
+    store = forensicstore.open(url)
+    list(execution_artifacts.select_registry(store))
+    plan = store.connection.execute("EXPLAIN QUERY PLAN " + execution_artifacts.REGISTRY_QUERY,
+                                    execution_artifacts.registry_query_parameters()).fetchall()
+    store.close()
+
+    details = [row[-1] for row in plan if row[-1].startswith(("SCAN", "SEARCH"))]
+    assert details and all("USING INDEX key_nocase_index" in detail for detail in details), details
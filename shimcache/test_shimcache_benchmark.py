@@ -0,0 +1,48 @@
+# Copyright (c) 2020 Siemens AG
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Throughput of read_cache for every cache format. Save a baseline with
+--benchmark-autosave and compare later runs against it with
+--benchmark-compare. The number of entries can be set with
+SHIMCACHE_BENCHMARK_ENTRIES.
+"""
+
+import os
+import tracemalloc
+
+import cache_generator
+import pytest
+import shimcache
+
+pytest.importorskip("pytest_benchmark")
+
+ENTRIES = int(os.environ.get("SHIMCACHE_BENCHMARK_ENTRIES", "1024"))
+
+
+@pytest.mark.parametrize("cache_format", sorted(cache_generator.FORMATS))
+def test_read_cache(benchmark, cache_format):
+    cache = cache_generator.FORMATS[cache_format](ENTRIES)
+
+    tracemalloc.start()
+    entries = list(shimcache.read_cache(cache))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    benchmark(lambda: list(shimcache.read_cache(cache)))
+
+    assert len(entries) == ENTRIES
+    benchmark.extra_info["peak_allocation"] = peak
+    if benchmark.stats:  # not set with --benchmark-disable
+        benchmark.extra_info["entries_per_second"] = ENTRIES / benchmark.stats.stats.mean